@@ -0,0 +1,97 @@
+# core/embedding_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# SQLite caps the number of bound parameters per statement
+SELECT_BATCH_SIZE = 900
+
+class CachedEmbeddings(Embeddings):
+    """Persistent SQLite cache in front of another LangChain embeddings object.
+
+    Vectors are keyed by sha256(model + text), so repeated texts (episode summaries on
+    reruns, shared script boilerplate) are only ever sent to the API once.
+    """
+
+    def __init__(self, base, db_path):
+        self.base = base
+        # OpenAI embeddings expose `model`, HuggingFace ones `model_name`
+        self.model = getattr(base, "model", None) or getattr(base, "model_name", "unknown")
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INT, vec BLOB)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        logging.info("Embedding cache opened at %s", db_path)
+
+    def _key(self, text, kind="document"):
+        # Queries get their own namespace - some models embed queries with an extra instruction
+        prefix = self.model if kind == "document" else f"{self.model}\n{kind}"
+        return hashlib.sha256(f"{prefix}\n{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """Fetch cached vectors for the given keys, one SELECT per batch of keys"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), SELECT_BATCH_SIZE):
+                batch = unique_keys[i:i + SELECT_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", batch)
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, keys, vectors):
+        rows = [(key, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+                for key, vector in zip(keys, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def _partition(self, texts, kind="document"):
+        """Split texts into cache hits and the (deduplicated) misses that still need embedding"""
+        keys = [self._key(text, kind) for text in texts]
+        cached = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        return keys, cached, missing
+
+    def _merge(self, keys, cached, missing, vectors):
+        if missing:
+            self._store(list(missing), vectors)
+            cached.update(zip(missing, vectors))
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts):
+        keys, cached, missing = self._partition(texts)
+        vectors = self.base.embed_documents(list(missing.values())) if missing else []
+        if missing:
+            logging.info("Embedding cache: %s hits, %s misses", len(texts) - len(missing), len(missing))
+        return self._merge(keys, cached, missing, vectors)
+
+    def embed_query(self, text):
+        keys, cached, missing = self._partition([text], kind="query")
+        vectors = [self.base.embed_query(text)] if missing else []
+        return self._merge(keys, cached, missing, vectors)[0]
+
+    async def aembed_documents(self, texts):
+        keys, cached, missing = self._partition(texts)
+        vectors = await self.base.aembed_documents(list(missing.values())) if missing else []
+        return self._merge(keys, cached, missing, vectors)
+
+    async def aembed_query(self, text):
+        keys, cached, missing = self._partition([text], kind="query")
+        vectors = [await self.base.aembed_query(text)] if missing else []
+        return self._merge(keys, cached, missing, vectors)[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,83 @@
+# core/episode_store.py
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Episodes kept in memory per store; less recently used ones are spilled to disk
+MAX_EPISODES_IN_MEMORY = int(os.getenv("MAX_EPISODES_IN_MEMORY", "20"))
+
+class EpisodeStore(MutableMapping):
+    """Dict of episode number -> {"script": ..., "critique": ...} with bounded memory use.
+
+    Only the `max_in_memory` most recently used episodes stay in RAM; older ones are written
+    to JSON files and read back (becoming recent again) when accessed. Membership and len()
+    cover both, so it can stand in for a plain dict. Without a `spill_dir`, a temporary
+    directory is created on the first spill and removed with the store.
+    """
+
+    def __init__(self, max_in_memory=MAX_EPISODES_IN_MEMORY, spill_dir=None):
+        self.max_in_memory = max_in_memory
+        self._spill_dir = spill_dir
+        self._tmp_dir = None
+        self._memory = OrderedDict()
+        self._spilled = set()
+
+    def _path(self, episode_number):
+        if self._spill_dir is None:
+            self._tmp_dir = tempfile.TemporaryDirectory(prefix="story_gen_episodes_")
+            self._spill_dir = self._tmp_dir.name
+        os.makedirs(self._spill_dir, exist_ok=True)
+        return os.path.join(self._spill_dir, f"ep_{episode_number}.json")
+
+    def _evict(self):
+        while len(self._memory) > self.max_in_memory:
+            episode_number, episode = self._memory.popitem(last=False)
+            with open(self._path(episode_number), "w", encoding="utf-8") as f:
+                json.dump(episode, f)
+            self._spilled.add(episode_number)
+            logging.debug("Episode %s spilled to disk", episode_number)
+
+    def _unspill(self, episode_number):
+        self._spilled.discard(episode_number)
+        os.remove(self._path(episode_number))
+
+    def __getitem__(self, episode_number):
+        if episode_number in self._memory:
+            self._memory.move_to_end(episode_number)
+            return self._memory[episode_number]
+        if episode_number not in self._spilled:
+            raise KeyError(episode_number)
+        with open(self._path(episode_number), "r", encoding="utf-8") as f:
+            episode = json.load(f)
+        self._unspill(episode_number)
+        self._memory[episode_number] = episode
+        self._evict()
+        return episode
+
+    def __setitem__(self, episode_number, episode):
+        if episode_number in self._spilled:
+            self._unspill(episode_number)
+        self._memory[episode_number] = episode
+        self._memory.move_to_end(episode_number)
+        self._evict()
+
+    def __delitem__(self, episode_number):
+        if episode_number in self._memory:
+            del self._memory[episode_number]
+        elif episode_number in self._spilled:
+            self._unspill(episode_number)
+        else:
+            raise KeyError(episode_number)
+
+    def __contains__(self, episode_number):
+        # Checked on every rerun for status badges - never loads a spilled episode
+        return episode_number in self._memory or episode_number in self._spilled
+
+    def __iter__(self):
+        return iter(list(self._memory) + list(self._spilled))
+
+    def __len__(self):
+        return len(self._memory) + len(self._spilled)
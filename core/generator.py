@@ -1,93 +1,260 @@
 # core/generator.py
-from openai import OpenAI
+import asyncio
 import logging
-from utils.config import GENERATOR_MODEL, load_api_key
+import textwrap
+from functools import lru_cache
+from utils.config import GENERATOR_MODEL, SUMMARIZER_MODEL, load_api_key
+from utils.async_runner import run_sync
+from utils.llm_client import ConcurrentOpenAI, estimate_tokens
 from core.memory_manager import MemoryManager # Import to use type hinting
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 # Define max scenes per episode to prevent runaway generation
 MAX_SCENES_PER_EPISODE = 10
 
-class EpisodicGenerator:
-    def __init__(self, api_key):
-        self.client = OpenAI(api_key=api_key)
-        self.model = GENERATOR_MODEL
-        
-    def _generate_scene(self, episode_number, scene_number, episode_summary, character_info, context_summary, relevant_chunks, previous_scene_summary):
-        """Generates a single scene."""
-        logging.info(f"--- Generating Scene {scene_number} for Episode {episode_number} ---")
+# Max episodes generated at the same time, keeps batch runs under the OpenAI RPM limit
+MAX_CONCURRENT_EPISODES = 4
+
+# Once the earlier-scenes text passes this many tokens, the oldest scenes get summarized
+SCENE_HISTORY_TOKEN_BUDGET = 1500
+SCENE_SUMMARY_MAX_TOKENS = 200
+
+# Marker the model appends to the final scene of an episode
+EPISODE_END_MARKER = "# EPISODE END"
+
+# Scene prompt templates, parsed and dedented once at import (the source indentation used
+# to be sent to the model as whitespace tokens on every line)
+SCENE_SYSTEM_TEMPLATE = textwrap.dedent("""
+    You are a screenwriter AI writing Episode {episode_number}, one scene at a time.
+
+    Instructions for every scene:
+    - Write ONLY the requested scene in standard screenplay format (SCENE HEADING, Action, CHARACTER, Dialogue).
+    - The scene should logically follow the previous scene and work towards the overall Episode Goal.
+    - Keep character actions and dialogue consistent with their established traits and the situation.
+    - Focus on advancing the plot, revealing information, or developing characters relevant to this episode's goal.
+    - Keep the scene concise (e.g., 100-400 words).
+    - **Crucially**: Do NOT write subsequent scenes. Only output the content for the requested scene.
+    - If you think the episode goal is met or it's a natural conclusion point, you can make this the final scene. Add a comment like "{end_marker}" at the very end if so.
+    """)
 
-        prompt = f"""
-        You are a screenwriter AI writing Scene {scene_number} of Episode {episode_number}.
+EPISODE_CONTEXT_TEMPLATE = textwrap.dedent("""
+    Overall Episode Goal / Summary: {episode_summary}
 
-        Overall Episode Goal / Summary: {episode_summary}
+    Context from Past Episodes & World:
+    {context_summary}
 
-        Context from Past Episodes & World:
-        {context_summary}
+    Characters Potentially Involved (refer to their state/motivations):
+    {character_info}
 
-        Characters Potentially Involved (refer to their state/motivations):
-        {character_info}
+    Relevant Snippets from Past (use if helpful):
+    {relevant_chunks}
+    """)
 
-        Relevant Snippets from Past (use if helpful):
-        {relevant_chunks}
+SCENE_TEMPLATE = textwrap.dedent("""
+    Story So Far in this Episode (earlier scenes summarized, latest scene in full):
+    {previous_scene_summary}
 
-        Summary of Previous Scene (Scene {scene_number-1}) in this Episode:
-        {previous_scene_summary if scene_number > 1 else 'This is the first scene.'}
+    Write ONLY Scene {scene_number}.
 
-        Instructions for Scene {scene_number}:
-        - Write ONLY Scene {scene_number} in standard screenplay format (SCENE HEADING, Action, CHARACTER, Dialogue).
-        - The scene should logically follow the previous scene and work towards the overall Episode Goal.
-        - Keep character actions and dialogue consistent with their established traits and the situation.
-        - Focus on advancing the plot, revealing information, or developing characters relevant to this episode's goal.
-        - Keep the scene concise (e.g., 100-400 words).
-        - **Crucially**: Do NOT write subsequent scenes. Only output the content for Scene {scene_number}.
-        - If you think the episode goal is met or it's a natural conclusion point, you can make this the final scene. Add a comment like "# EPISODE END" at the very end if so.
+    Begin Scene {scene_number}:
+    """)
 
-        Begin Scene {scene_number}:
+@lru_cache(maxsize=64)
+def _scene_system_prompt(episode_number):
+    return SCENE_SYSTEM_TEMPLATE.format(episode_number=episode_number, end_marker=EPISODE_END_MARKER)
+
+class EpisodicGenerator:
+    def __init__(self, api_key, max_concurrent=MAX_CONCURRENT_EPISODES, client=None, embeddings=None, scene_cache=None):
+        self.client = client or ConcurrentOpenAI(api_key=api_key)
+        self.model = GENERATOR_MODEL
+        self.max_concurrent = max_concurrent
+        # Optional semantic cache of scene completions, needs embeddings to key prompts
+        self.embeddings = embeddings
+        self.scene_cache = scene_cache if embeddings is not None else None
+        
+    async def _embed_prompt(self, prompt):
+        """Embed a scene prompt for the scene cache. Returns None if embedding fails."""
+        try:
+            return await self.embeddings.aembed_query(prompt)
+        except Exception as e:
+            logging.warning("Could not embed scene prompt for caching: %s", e)
+            return None
+            
+    def _lookup_cached_scene(self, cache_scope, episode_number, scene_number, prompt_vector):
+        try:
+            return self.scene_cache.lookup(cache_scope, episode_number, scene_number, prompt_vector)
+        except Exception as e:
+            logging.warning("Scene cache lookup failed: %s", e)
+            return None
+            
+    def _store_cached_scene(self, cache_scope, episode_number, scene_number, prompt_vector, scene_script):
+        try:
+            self.scene_cache.store(cache_scope, episode_number, scene_number, prompt_vector, scene_script)
+        except Exception as e:
+            logging.warning("Scene cache store failed: %s", e)
+        
+    def _build_system_prompt(self, episode_number):
+        """Scene-independent instructions, sent first so every scene call shares them."""
+        return _scene_system_prompt(episode_number)
+
+    def _build_prompt_prefix(self, episode_number, episode_summary, character_info, context_summary, relevant_chunks):
+        """Renders the context block shared by every scene of an episode."""
+        return EPISODE_CONTEXT_TEMPLATE.format(
+            episode_summary=episode_summary,
+            context_summary=context_summary,
+            character_info=character_info,
+            relevant_chunks=relevant_chunks
+        )
+
+    def _build_scene_prompt(self, scene_number, previous_scene_summary):
+        """Renders the only part of the prompt that changes from scene to scene."""
+        return SCENE_TEMPLATE.format(
+            scene_number=scene_number,
+            previous_scene_summary=previous_scene_summary if scene_number > 1 else 'This is the first scene.'
+        )
+
+    async def _generate_scene(self, episode_number, scene_number, prompt_prefix, previous_scene_summary, bypass_cache=False, on_text=None, cache_scope=None):
+        """Generates a single scene. Set bypass_cache to force a fresh completion (re-rolls).
+
+        on_text, if given, receives the scene text as it is produced. cache_scope limits scene
+        cache hits to the same planned episode (SemanticCache.scope_for).
         """
+        logging.info("--- Generating Scene %s for Episode %s ---", scene_number, episode_number)
+
+        scene_prompt = self._build_scene_prompt(scene_number, previous_scene_summary)
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": f"You are writing Scene {scene_number} of Episode {episode_number}."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.75,  # Slightly higher temp for scene creativity
-                max_tokens=700  # Limit tokens per scene
-            )
-            scene_script = response.choices[0].message.content.strip()
-            logging.info(f"--- Scene {scene_number} Generated (approx. {len(scene_script.split())} words) ---")
+            scene_script = None
+            prompt_vector = await self._embed_prompt(prompt_prefix + scene_prompt) if self.scene_cache and cache_scope else None
+            if prompt_vector is not None and not bypass_cache:
+                scene_script = self._lookup_cached_scene(cache_scope, episode_number, scene_number, prompt_vector)
+                if scene_script:
+                    logging.info("--- Scene %s served from scene cache ---", scene_number)
+                    if on_text:
+                        on_text(scene_script)
+            
+            if scene_script is None:
+                scene_script = await self._request_scene(episode_number, scene_number, prompt_prefix, scene_prompt, on_text)
+                if prompt_vector is not None:
+                    self._store_cached_scene(cache_scope, episode_number, scene_number, prompt_vector, scene_script)
 
             # Basic check if LLM indicated episode end
-            episode_complete = scene_script.endswith("# EPISODE END")
+            episode_complete = scene_script.endswith(EPISODE_END_MARKER)
             
-            return scene_script, previous_scene_summary + "\n\n" + scene_script, episode_complete
+            return scene_script, episode_complete
             
         except Exception as e:
             logging.error(f"Error generating Scene {scene_number}: {e}")
-            return f"Error generating Scene {scene_number}", "Error", True  # Signal episode end on error
+            return f"Error generating Scene {scene_number}", True  # Signal episode end on error
     
-    def generate_episode_script(self, episode_number, episode_summary, context_summary, character_info, relevant_chunks):
-        """Generates a full episode by generating scenes sequentially."""
-        logging.info(f"--- Beginning Episode {episode_number} Generation ---")
-        logging.info(f"Episode Goal: {episode_summary}")
+    def _scene_request(self, episode_number, prompt_prefix, scene_prompt):
+        """Chat completion arguments for one scene.
+
+        The system prompt and context block are identical for every scene of the episode and
+        come first, so OpenAI's automatic prompt caching can reuse them; only the last
+        message changes between calls.
+        """
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self._build_system_prompt(episode_number)},
+                {"role": "user", "content": prompt_prefix},
+                {"role": "user", "content": scene_prompt}
+            ],
+            temperature=0.75,  # Slightly higher temp for scene creativity
+            max_tokens=700,  # Limit tokens per scene
+            # Routes an episode's scene calls to the same cache; sent raw so older SDKs accept it
+            extra_body={"prompt_cache_key": f"episode-{episode_number}"}
+        )
+
+    @staticmethod
+    def _clean_scene_text(scene_script):
+        if EPISODE_END_MARKER in scene_script:
+            # Drop anything streamed after the marker before the stream was closed
+            scene_script = scene_script[:scene_script.index(EPISODE_END_MARKER) + len(EPISODE_END_MARKER)]
+        return scene_script.strip()
+
+    async def _request_scene(self, episode_number, scene_number, prompt_prefix, scene_prompt, on_text=None):
+        """Streams one scene from the model and returns its text, stopping early at the end marker."""
+        scene_script = await self.client.astream_text(
+            stop_marker=EPISODE_END_MARKER,
+            on_text=on_text,
+            **self._scene_request(episode_number, prompt_prefix, scene_prompt)
+        )
+        scene_script = self._clean_scene_text(scene_script)
+        logging.info("--- Scene %s Generated (approx. %d words) ---", scene_number, len(scene_script) // 6)
+        return scene_script
+    
+    async def _summarize_scenes(self, episode_number, rolling_summary, scenes):
+        """Folds older scenes into the rolling summary. Returns None if the call fails."""
+        earlier = f"Summary so far:\n{rolling_summary}\n\n" if rolling_summary else ""
+        try:
+            response = await self.client.achat(
+                model=SUMMARIZER_MODEL,
+                messages=[
+                    {"role": "system", "content": f"You condense screenplay scenes from Episode {episode_number} for the writer of the next scene."},
+                    {"role": "user", "content": f"{earlier}Scenes:\n" + "\n\n".join(scenes) +
+                        f"\n\nSummarize everything above in at most {SCENE_SUMMARY_MAX_TOKENS} tokens, preserving plot developments and changes to characters."}
+                ],
+                temperature=0.3,
+                max_tokens=SCENE_SUMMARY_MAX_TOKENS
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logging.warning("Could not summarize earlier scenes of Episode %s: %s", episode_number, e)
+            return None
+
+    async def _roll_scene_history(self, episode_number, rolling_summary, recent_scenes):
+        """Keeps the earlier-scenes text under SCENE_HISTORY_TOKEN_BUDGET.
+
+        The latest scene always stays verbatim; when over budget, the oldest half of the
+        other verbatim scenes is merged into the rolling summary.
+        """
+        history_tokens = estimate_tokens(self.model, rolling_summary + "".join(recent_scenes))
+        if history_tokens > SCENE_HISTORY_TOKEN_BUDGET and len(recent_scenes) > 1:
+            fold_count = max(1, (len(recent_scenes) - 1) // 2)
+            summary = await self._summarize_scenes(episode_number, rolling_summary, recent_scenes[:fold_count])
+            if summary:
+                logging.info("Summarized %s earlier scene(s) of Episode %s (%s tokens of history)", fold_count, episode_number, history_tokens)
+                return summary, recent_scenes[fold_count:]
+        return rolling_summary, recent_scenes
+
+    @staticmethod
+    def _render_scene_history(rolling_summary, recent_scenes):
+        parts = [f"(Summary of earlier scenes) {rolling_summary}"] if rolling_summary else []
+        return "\n\n".join(parts + recent_scenes)
+
+    async def generate_episode_script(self, episode_number, episode_summary, context_summary, character_info, relevant_chunks, bypass_cache=False, scene_indexer=None, on_text=None):
+        """Generates a full episode by generating scenes sequentially.
+
+        scene_indexer, if given, is an async callable (episode_number, scene_script) started as
+        soon as each scene is finished, so indexing overlaps with generating the next scene.
+        on_text, if given, is called with the script text as it streams in (raw model output,
+        scenes separated by blank lines).
+        """
+        logging.info("--- Beginning Episode %s Generation ---", episode_number)
+        logging.info("Episode Goal: %s", episode_summary)
         
         full_episode_script = []
         scene_number = 1
         previous_scenes_summary = ""
+        rolling_summary, recent_scenes = "", []
+        index_tasks = []
         episode_complete = False
+        # Context, characters and snippets are identical for every scene, so render them once
+        prompt_prefix = self._build_prompt_prefix(episode_number, episode_summary, character_info, context_summary, relevant_chunks)
+        cache_scope = self.scene_cache.scope_for(episode_summary) if self.scene_cache else None
         
         while scene_number <= MAX_SCENES_PER_EPISODE and not episode_complete:
-            scene_script, updated_summary, episode_complete = self._generate_scene(
+            if on_text and scene_number > 1:
+                on_text("\n\n")
+            scene_script, episode_complete = await self._generate_scene(
                 episode_number, 
                 scene_number, 
-                episode_summary,
-                character_info,
-                context_summary,
-                relevant_chunks,
-                previous_scenes_summary
+                prompt_prefix,
+                previous_scenes_summary,
+                bypass_cache=bypass_cache,
+                on_text=on_text,
+                cache_scope=cache_scope
             )
             
             if "Error generating Scene" in scene_script:
@@ -95,13 +262,94 @@ class EpisodicGenerator:
                 break
                 
             full_episode_script.append(scene_script)
-            previous_scenes_summary = updated_summary
+            if scene_indexer is not None:
+                index_tasks.append(asyncio.create_task(scene_indexer(episode_number, scene_script)))
             scene_number += 1
+            if not episode_complete and scene_number <= MAX_SCENES_PER_EPISODE:
+                rolling_summary, recent_scenes = await self._roll_scene_history(
+                    episode_number, rolling_summary, recent_scenes + [scene_script])
+                previous_scenes_summary = self._render_scene_history(rolling_summary, recent_scenes)
             
             # Check if we've hit our scene limit
             if scene_number > MAX_SCENES_PER_EPISODE and not episode_complete:
                 full_episode_script.append("# SCENE LIMIT REACHED - EPISODE INCOMPLETE")
                 logging.warning(f"Episode {episode_number} hit maximum scene limit ({MAX_SCENES_PER_EPISODE})")
         
-        logging.info(f"--- Episode {episode_number} Generation Complete ({len(full_episode_script)} scenes) ---")
-        return "\n\n".join(full_episode_script)
\ No newline at end of file
+        for result in await asyncio.gather(*index_tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logging.warning("Indexing a scene of Episode %s failed: %s", episode_number, result)
+        
+        logging.info("--- Episode %s Generation Complete (%s scenes) ---", episode_number, len(full_episode_script))
+        return "\n\n".join(full_episode_script)
+
+    async def generate_episodes_batch(self, episode_specs):
+        """Generates several independent episodes concurrently.
+
+        Each spec is a dict of generate_episode_script keyword arguments. Scenes inside an
+        episode stay sequential since every scene prompt needs the previous scene's text.
+        Returns the scripts in the same order as the specs.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def _bounded(spec):
+            async with semaphore:
+                return await self.generate_episode_script(**spec)
+
+        return await asyncio.gather(*[_bounded(spec) for spec in episode_specs])
+
+    def generate_episodes_with_batch_api(self, episode_specs):
+        """Generates several episodes through the OpenAI Batch API (half price, up to 24h per batch).
+
+        Takes the same specs as generate_episodes_batch. Scene k of every unfinished episode
+        goes into one batch; the next batch is built from the returned scenes, so an episode
+        of N scenes takes N batches. Blocks until done, meant for offline season runs.
+        Returns the scripts in the same order as the specs.
+        """
+        episodes = []
+        for spec in episode_specs:
+            episodes.append({
+                "number": spec["episode_number"],
+                "prefix": self._build_prompt_prefix(spec["episode_number"], spec["episode_summary"], spec["character_info"],
+                                                    spec["context_summary"], spec["relevant_chunks"]),
+                "scenes": [], "history": "", "rolling_summary": "", "recent_scenes": [], "complete": False
+            })
+
+        for scene_number in range(1, MAX_SCENES_PER_EPISODE + 1):
+            active = [episode for episode in episodes if not episode["complete"]]
+            if not active:
+                break
+            logging.info("--- Batch-generating Scene %s for %s episode(s) ---", scene_number, len(active))
+            requests = {
+                f"ep{episode['number']}_sc{scene_number}": self._scene_request(
+                    episode["number"], episode["prefix"], self._build_scene_prompt(scene_number, episode["history"]))
+                for episode in active
+            }
+            results = self.client.run_batch(requests)
+
+            for episode in active:
+                body = results.get(f"ep{episode['number']}_sc{scene_number}")
+                if body is None:
+                    episode["scenes"].append(f"ERROR GENERATING SCENE {scene_number}: Generation stopped.")
+                    episode["complete"] = True
+                    continue
+                scene_script = self._clean_scene_text(body["choices"][0]["message"]["content"] or "")
+                episode["scenes"].append(scene_script)
+                episode["complete"] = scene_script.endswith(EPISODE_END_MARKER)
+
+            # Earlier-scene summaries are short, so they use regular (concurrent) calls
+            to_roll = [episode for episode in active if not episode["complete"] and scene_number < MAX_SCENES_PER_EPISODE]
+            async def _roll_all():
+                return await asyncio.gather(*[
+                    self._roll_scene_history(episode["number"], episode["rolling_summary"], episode["recent_scenes"] + [episode["scenes"][-1]])
+                    for episode in to_roll
+                ])
+            rolled = run_sync(_roll_all())
+            for episode, (rolling_summary, recent_scenes) in zip(to_roll, rolled):
+                episode["rolling_summary"], episode["recent_scenes"] = rolling_summary, recent_scenes
+                episode["history"] = self._render_scene_history(rolling_summary, recent_scenes)
+
+        for episode in episodes:
+            if not episode["complete"]:
+                episode["scenes"].append("# SCENE LIMIT REACHED - EPISODE INCOMPLETE")
+                logging.warning("Episode %s hit maximum scene limit (%s)", episode["number"], MAX_SCENES_PER_EPISODE)
+        return ["\n\n".join(episode["scenes"]) for episode in episodes]
@@ -1,21 +1,195 @@
 # core/memory_manager.py
+import asyncio
+import bisect
 import logging
 import os
 import json
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import orjson
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
+from core.embedding_cache import CachedEmbeddings
+from core.vector_index import NumpyVectorStore
+from utils.config import EMBEDDING_BACKEND, USE_VEC_INDEX, VECTOR_DTYPE
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Max inputs OpenAI accepts in a single embeddings request
+EMBEDDING_BATCH_SIZE = 2048
+# Max total input tokens OpenAI accepts in a single embeddings request (300k, with headroom)
+EMBEDDING_BATCH_TOKENS = 250_000
+# Conservative chars-per-token ratio used to size batches without tokenizing every chunk
+CHARS_PER_TOKEN = 3
+# Max embedding batches in flight at once
+MAX_EMBEDDING_WORKERS = 4
+
+# Local sentence-transformers model used by the "minilm" embedding backend
+MINILM_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Vector size produced by each embedding backend
+EMBEDDING_DIMS = {"openai": 1536, "minilm": 384}
+
+# HNSW settings for newly created Chroma collections (existing ones keep theirs)
+CHROMA_COLLECTION_METADATA = {"hnsw:space": "cosine", "hnsw:M": 32, "hnsw:construction_ef": 200}
+
+# Logged character/plot events between JSON snapshots
+SNAPSHOT_EVERY = 200
+# Write buffer for the event log handles
+EVENT_LOG_BUFFER_SIZE = 1 << 16
+
+class SqliteVecStore:
+    """Local vector store on a sqlite-vec vec0 table, usable in place of ChromaStore.
+
+    Vectors live in the `vec_chunks` virtual table and chunk text/metadata in a sibling
+    `chunks` table sharing the same rowid, so KNN search runs indexed inside SQLite.
+    """
+    
+    def __init__(self, db_path, embedding_function, dim=1536):
+        import sqlite_vec  # Only needed when this backend is enabled
+        
+        self.embedding_function = embedding_function
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.enable_load_extension(True)
+        sqlite_vec.load(self._conn)
+        self._conn.enable_load_extension(False)
+        self._conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS vec_chunks USING vec0(embedding FLOAT[{dim}])")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (rowid INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata_json TEXT)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def _serialize(vector):
+        return np.asarray(vector, dtype=np.float32).tobytes()
+        
+    def add_texts(self, texts, metadatas=None):
+        """Embed and store texts (same signature as the LangChain vector stores)"""
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+        
+    def add_embeddings(self, texts, embeddings, metadatas=None):
+        """Store texts with precomputed embeddings, writing both tables in one transaction"""
+        metadatas = metadatas or [{}] * len(texts)
+        rowids = []
+        with self._lock:
+            for text, vector, metadata in zip(texts, embeddings, metadatas):
+                cursor = self._conn.execute("INSERT INTO chunks (text, metadata_json) VALUES (?, ?)", (text, json.dumps(metadata)))
+                self._conn.execute("INSERT INTO vec_chunks (rowid, embedding) VALUES (?, ?)", (cursor.lastrowid, self._serialize(vector)))
+                rowids.append(cursor.lastrowid)
+            self._conn.commit()
+        return rowids
+        
+    def similarity_search(self, query, k=4):
+        """Return the k chunks nearest to the query as LangChain Documents"""
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+        
+    def similarity_search_by_vector(self, embedding, k=4):
+        query_vector = self._serialize(embedding)
+        with self._lock:
+            rows = self._conn.execute("""
+                WITH knn AS (
+                    SELECT rowid, distance FROM vec_chunks WHERE embedding MATCH ? AND k = ?
+                )
+                SELECT chunks.text, chunks.metadata_json FROM knn
+                JOIN chunks ON chunks.rowid = knn.rowid
+                ORDER BY knn.distance
+            """, (query_vector, k)).fetchall()
+        return [Document(page_content=text, metadata=json.loads(metadata_json or "{}")) for text, metadata_json in rows]
+        
+    def persist(self):
+        """Kept for parity with Chroma - writes are committed as they happen"""
+        with self._lock:
+            self._conn.commit()
+
+class ChromaStore:
+    """Vector store on a chromadb collection, used directly instead of through the LangChain wrapper.
+    
+    Texts are embedded by our own (cached, throttled) embeddings and handed to Chroma as one
+    float32 array per add() call, so there is no per-document Python dispatch.
+    """
+    
+    def __init__(self, path, collection_name, embedding_function):
+        import chromadb
+        from chromadb.config import Settings
+        
+        self.embedding_function = embedding_function
+        self._client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        try:
+            # Open existing collections as-is - their distance metric can't change after creation
+            self.collection = self._client.get_collection(collection_name, embedding_function=None)
+        except Exception:
+            self.collection = self._client.create_collection(collection_name, metadata=CHROMA_COLLECTION_METADATA, embedding_function=None)
+        
+    def add_texts(self, texts, metadatas=None):
+        """Embed and store texts (same signature as the LangChain vector stores)"""
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+        
+    def add_embeddings(self, texts, embeddings, metadatas=None):
+        """Store texts with precomputed embeddings in a single collection.add() call"""
+        ids = [str(uuid.uuid4()) for _ in texts]
+        self.collection.add(
+            ids=ids,
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            documents=list(texts),
+            metadatas=metadatas
+        )
+        return ids
+        
+    def similarity_search(self, query, k=4):
+        """Return the k chunks nearest to the query as LangChain Documents"""
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+        
+    def similarity_search_by_vector(self, embedding, k=4):
+        result = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            include=["documents", "metadatas"]
+        )
+        return [Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(result["documents"][0], result["metadatas"][0])]
+        
+    def persist(self):
+        """Kept for parity with the other stores - PersistentClient writes through"""
+        
+def _write_json_atomic(path, data):
+    """Write compact JSON to a temp file and swap it in, so a crash never leaves a torn snapshot"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        # Character names come from the LLM and may be null, hence OPT_NON_STR_KEYS
+        f.write(orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+def _episode_key(episode):
+    """Sort key for episode numbers - entries without one sort last, as before"""
+    return float("inf") if episode is None else episode
+
+def _local_device():
+    """Run local embedding models on the GPU when one is available"""
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
 
 class MemoryManager:
     """Manages the story's persistent memory using vector and relational storage"""
     
-    def __init__(self, api_key=None, db_path="memory/db"):
+    def __init__(self, api_key=None, db_path="memory/db", client=None, embedding_backend=EMBEDDING_BACKEND, vector_dtype=VECTOR_DTYPE):
         """Initialize memory manager with vector store and relational data"""
+        if embedding_backend not in EMBEDDING_DIMS:
+            raise ValueError(f"Unknown embedding backend '{embedding_backend}'. Use one of: {', '.join(EMBEDDING_DIMS)}")
         self.api_key = api_key
         self.db_path = db_path
+        self.client = client  # Shared ConcurrentOpenAI, embeddings go through its rate limiter
+        self.embedding_backend = embedding_backend
+        self.embedding_dim = EMBEDDING_DIMS[embedding_backend]
+        self.vector_dtype = vector_dtype  # fp32 / fp16 / int8 selects the NumPy index, None keeps Chroma / sqlite-vec
         
         # Ensure directory exists
         os.makedirs(self.db_path, exist_ok=True)
@@ -27,17 +201,13 @@ class MemoryManager:
             length_function=len
         )
         
-        # Initialize vector store with OpenAI embeddings if API key provided
-        if api_key:
+        self.collection = None  # Raw chromadb collection when the Chroma backend is in use
+        
+        # Initialize vector store if we can embed - OpenAI embeddings need an API key, local ones don't
+        if api_key or embedding_backend != "openai":
             try:
-                self.embeddings = OpenAIEmbeddings(openai_api_key=api_key)
-                vector_store_path = os.path.join(self.db_path, "vector_store")
-                os.makedirs(vector_store_path, exist_ok=True)  # Ensure directory exists
-                self.vector_store = Chroma(
-                    persist_directory=vector_store_path,
-                    embedding_function=self.embeddings
-                )
-                logging.info(f"Vector store initialized at {vector_store_path}")
+                self.embeddings = self._build_embeddings()
+                self.vector_store = self._build_vector_store()
             except Exception as e:
                 logging.error(f"Failed to initialize vector store: {str(e)}", exc_info=True)
                 self.vector_store = None
@@ -51,54 +221,232 @@ class MemoryManager:
         self.plot_points = {}
         self.plot_counter = 0  # For assigning unique IDs to plot points
         
+        # Characters / plot ids sorted by the episode they entered the story, with parallel
+        # key lists for bisect, so context building only visits what existed before an episode.
+        # The *_order dicts keep their insertion position, which is the order summaries list them in.
+        self._char_first_eps, self._chars_by_first_appearance = [], []
+        self._plot_added_eps, self._plots_by_episode_added = [], []
+        self._char_order, self._plot_order = {}, {}
+        
+        # Bumped on every state change; summary strings are memoized against it
+        self._state_version = 0
+        self._summary_cache = {}  # { (kind, episode_number, state_version): summary }
+        
+        # Mutations are appended to JSONL event logs and folded into the JSON snapshots
+        # every SNAPSHOT_EVERY events (and on close), so each change costs one line of I/O
+        self._char_log_path = os.path.join(self.db_path, "characters.log.jsonl")
+        self._plot_log_path = os.path.join(self.db_path, "plots.log.jsonl")
+        self._log_seq = 0  # Sequence number of the last logged event
+        self._events_since_snapshot = 0
+        self._state_lock = threading.RLock()
+        self._index_lock = threading.Lock()  # Serializes vector store writes from indexing threads
+        # Embedded scene chunks per episode, held back until the episode is finished
+        self._staged_scenes = {}
+        
         # Load existing data if available
         self._load_persistent_data()
+        # Opened once for the manager's lifetime; events are encoded straight to bytes
+        self._char_log = open(self._char_log_path, "ab", buffering=EVENT_LOG_BUFFER_SIZE)
+        self._plot_log = open(self._plot_log_path, "ab", buffering=EVENT_LOG_BUFFER_SIZE)
+            
+    def _build_embeddings(self):
+        """Create the cached embeddings client for the configured backend"""
+        if self.embedding_backend == "minilm":
+            # Local model, no API round-trip. Only imported when selected.
+            from langchain_huggingface import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings(
+                model_name=MINILM_MODEL,
+                model_kwargs={"device": _local_device()},
+                encode_kwargs={"batch_size": 64, "normalize_embeddings": True}
+            )
+        else:
+            embeddings = OpenAIEmbeddings(
+                openai_api_key=self.api_key,
+                chunk_size=EMBEDDING_BATCH_SIZE,
+                max_retries=6
+            )
+            # Throttle through the shared client so embeddings share its rate-limit budget
+            if self.client:
+                embeddings = self.client.wrap_embeddings(embeddings)
+        # Cache sits outermost so cache hits don't use up rate-limit capacity
+        return CachedEmbeddings(embeddings, os.path.join(self.db_path, "embedding_cache.sqlite3"))
+            
+    def _collection_name(self):
+        """Chroma collection for the current backend - vectors of different sizes can't share one"""
+        return "langchain" if self.embedding_backend == "openai" else f"story_{self.embedding_backend}"
+            
+    def index_suffix(self):
+        """Filename suffix that keeps each embedding backend's index files apart"""
+        return "" if self.embedding_backend == "openai" else f"_{self.embedding_backend}"
+            
+    def _build_vector_store(self):
+        """Create the configured vector store (NumPy, sqlite-vec or Chroma) inside the memory directory"""
+        if self.vector_dtype:
+            index_path = os.path.join(self.db_path, f"numpy_index{self.index_suffix()}")
+            return NumpyVectorStore(index_path, self.embeddings, dim=self.embedding_dim, vector_dtype=self.vector_dtype)
+            
+        if USE_VEC_INDEX:
+            vec_path = os.path.join(self.db_path, f"vec_index{self.index_suffix()}.sqlite3")
+            store = SqliteVecStore(vec_path, self.embeddings, dim=self.embedding_dim)
+            logging.info("sqlite-vec vector store initialized at %s", vec_path)
+            return store
+            
+        vector_store_path = os.path.join(self.db_path, "vector_store")
+        os.makedirs(vector_store_path, exist_ok=True)  # Ensure directory exists
+        store = ChromaStore(vector_store_path, self._collection_name(), self.embeddings)
+        self.collection = store.collection
+        logging.info("Vector store initialized at %s", vector_store_path)
+        return store
+            
+    def _embedding_batches(self, texts):
+        """Split texts into as few requests as possible, within both the input-count and token limits"""
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = len(text) // CHARS_PER_TOKEN + 1
+            if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+            
+    def _embed_in_batches(self, texts):
+        """Embed texts in provider-sized batches, sending the batches concurrently"""
+        batches = self._embedding_batches(texts)
+        if len(batches) == 1:
+            return self.embeddings.embed_documents(batches[0])
+        
+        with ThreadPoolExecutor(max_workers=min(len(batches), MAX_EMBEDDING_WORKERS)) as pool:
+            results = pool.map(self.embeddings.embed_documents, batches)
+            return [vector for batch in results for vector in batch]
             
     def _load_persistent_data(self):
-        """Load character and plot data from disk if available"""
+        """Load the character and plot snapshots from disk, then replay the event logs on top"""
         char_path = os.path.join(self.db_path, "characters.json")
         plot_path = os.path.join(self.db_path, "plots.json")
         counter_path = os.path.join(self.db_path, "counter.json")
         
         try:
             if os.path.exists(char_path):
-                with open(char_path, 'r') as f:
-                    self.characters = json.load(f)
-                logging.info(f"Loaded {len(self.characters)} characters from persistent storage.")
+                self.characters = _read_json(char_path)
+                logging.info("Loaded %s characters from persistent storage.", len(self.characters))
                 
             if os.path.exists(plot_path):
-                with open(plot_path, 'r') as f:
-                    self.plot_points = json.load(f)
-                logging.info(f"Loaded {len(self.plot_points)} plot points from persistent storage.")
+                self.plot_points = _read_json(plot_path)
+                logging.info("Loaded %s plot points from persistent storage.", len(self.plot_points))
                 
             if os.path.exists(counter_path):
-                with open(counter_path, 'r') as f:
-                    counter_data = json.load(f)
-                    self.plot_counter = counter_data.get("plot_counter", 0)
-                logging.info(f"Loaded counter state. Plot counter: {self.plot_counter}")
+                counter_data = _read_json(counter_path)
+                self.plot_counter = counter_data.get("plot_counter", 0)
+                self._log_seq = counter_data.get("log_seq", 0)
+                logging.info("Loaded counter state. Plot counter: %s", self.plot_counter)
+            self._rebuild_indexes()
+                
+            # Events at or below the snapshot's sequence number are already in the snapshot
+            snapshot_seq = self._log_seq
+            replayed = self._replay_log(self._char_log_path, snapshot_seq) + self._replay_log(self._plot_log_path, snapshot_seq)
+            self._events_since_snapshot = replayed
+            if replayed:
+                logging.info("Replayed %s logged memory events.", replayed)
         except Exception as e:
             logging.error(f"Error loading persistent data: {e}")
             
+    def _rebuild_indexes(self):
+        """Rebuild the first-appearance indexes for the loaded characters and plot points"""
+        self._char_order = {char_name: i for i, char_name in enumerate(self.characters)}
+        self._plot_order = {plot_id: i for i, plot_id in enumerate(self.plot_points)}
+        chars = sorted(self.characters.items(), key=lambda item: _episode_key(item[1].get("first_appearance")))
+        self._char_first_eps = [_episode_key(char_data.get("first_appearance")) for _, char_data in chars]
+        self._chars_by_first_appearance = [char_name for char_name, _ in chars]
+        
+        plots = sorted(self.plot_points.items(), key=lambda item: _episode_key(item[1].get("episode_added")))
+        self._plot_added_eps = [_episode_key(plot_data.get("episode_added")) for _, plot_data in plots]
+        self._plots_by_episode_added = [plot_id for plot_id, _ in plots]
+        self._state_version += 1
+            
+    @staticmethod
+    def _index_insert(keys, values, key, value):
+        index = bisect.bisect_right(keys, key)
+        keys.insert(index, key)
+        values.insert(index, value)
+            
+    def _replay_log(self, log_path, snapshot_seq):
+        """Apply logged events newer than the snapshot. Returns the number applied."""
+        if not os.path.exists(log_path):
+            return 0
+            
+        applied = 0
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    event = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # A torn final line from a crash mid-write - everything before it is intact
+                    logging.warning("Skipping unreadable event in %s", log_path)
+                    continue
+                if event.get("seq", 0) <= snapshot_seq:
+                    continue
+                self._apply_event(event)
+                self._log_seq = max(self._log_seq, event["seq"])
+                applied += 1
+        return applied
+            
+    def _apply_event(self, event):
+        op = event["op"]
+        if op == "char_state":
+            self._apply_char_state(event["name"], event["change"], event["ep"])
+        elif op == "plot_add":
+            self._apply_plot_add(event["id"], event["summary"], event["status"], event["ep"])
+            self.plot_counter = max(self.plot_counter, event["id"])
+        elif op == "plot_status":
+            self._apply_plot_status(str(event["id"]), event["status"], event["ep"])
+        else:
+            logging.warning("Unknown memory event '%s' ignored", op)
+            
+    def _append_event(self, log_file, event):
+        """Write one mutation to its event log"""
+        self._append_events(log_file, [event])
+
+    def _append_events(self, log_file, events):
+        """Write mutations to an event log in one write and one flush, snapshotting every SNAPSHOT_EVERY events"""
+        lines = []
+        for event in events:
+            self._log_seq += 1
+            event["seq"] = self._log_seq
+            lines.append(orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
+        log_file.write(b"".join(lines))
+        log_file.flush()
+        
+        self._events_since_snapshot += len(events)
+        if self._events_since_snapshot >= SNAPSHOT_EVERY:
+            self._save_persistent_data()
+            
     def _save_persistent_data(self):
-        """Save character and plot data to disk"""
+        """Snapshot character and plot data to disk and truncate the event logs"""
         char_path = os.path.join(self.db_path, "characters.json")
         plot_path = os.path.join(self.db_path, "plots.json")
         counter_path = os.path.join(self.db_path, "counter.json")
         
-        try:
-            with open(char_path, 'w') as f:
-                json.dump(self.characters, f, indent=2)
-                
-            with open(plot_path, 'w') as f:
-                json.dump(self.plot_points, f, indent=2)
-                
-            with open(counter_path, 'w') as f:
-                json.dump({"plot_counter": self.plot_counter}, f, indent=2)
-                
-            logging.info("Saved persistent memory data to disk.")
-        except Exception as e:
-            logging.error(f"Error saving persistent data: {e}")
+        with self._state_lock:
+            try:
+                _write_json_atomic(char_path, self.characters)
+                _write_json_atomic(plot_path, self.plot_points)
+                # Written last: its log_seq marks which logged events the snapshot already holds
+                _write_json_atomic(counter_path, {"plot_counter": self.plot_counter, "log_seq": self._log_seq})
+                    
+                for log_file in (self._char_log, self._plot_log):
+                    if not log_file.closed:
+                        log_file.seek(0)
+                        log_file.truncate()
+                self._events_since_snapshot = 0
+                    
+                logging.info("Saved persistent memory data to disk.")
+            except Exception as e:
+                logging.error(f"Error saving persistent data: {e}")
             
+
     def add_document_chunks(self, text, metadata=None):
         """Add text chunks to vector store with metadata"""
         if not self.vector_store:
@@ -136,30 +484,28 @@ class MemoryManager:
             logging.error(f"Error searching vector store: {e}")
             return []
             
-    def update_character_state(self, character_name, state_change, episode_number):
-        """Update a character's state with a new change"""
+    def _apply_char_state(self, character_name, state_change, episode_number):
+        self._state_version += 1
         if character_name not in self.characters:
             self.characters[character_name] = {
                 "name": character_name,
                 "first_appearance": episode_number,
                 "state_history": []
             }
+            self._index_insert(self._char_first_eps, self._chars_by_first_appearance, _episode_key(episode_number), character_name)
+            self._char_order[character_name] = len(self._char_order)
             
         # Add new state to history
         self.characters[character_name]["state_history"].append({
             "episode": episode_number,
             "change": state_change
         })
-        
-        # Save changes
-        self._save_persistent_data()
-        logging.info(f"Updated character '{character_name}' with new state in episode {episode_number}")
             
-    def add_plot_point(self, summary, status="introduced", episode_added=None):
-        """Add a new plot point/thread to track"""
-        self.plot_counter += 1
-        plot_id = self.plot_counter
-        
+    def _apply_plot_add(self, plot_id, summary, status, episode_added):
+        self._state_version += 1
+        if str(plot_id) not in self.plot_points:
+            self._index_insert(self._plot_added_eps, self._plots_by_episode_added, _episode_key(episode_added), str(plot_id))
+            self._plot_order[str(plot_id)] = len(self._plot_order)
         self.plot_points[str(plot_id)] = {
             "id": plot_id,
             "summary": summary,
@@ -169,34 +515,111 @@ class MemoryManager:
                 {"episode": episode_added, "status": status}
             ]
         }
-        
-        # Save changes
-        self._save_persistent_data()
-        logging.info(f"Added new plot point (ID: {plot_id}) in episode {episode_added}")
-        return plot_id
-            
-    def update_plot_status(self, plot_id, new_status, episode_number):
-        """Update a plot point's status"""
-        plot_id_str = str(plot_id)  # Convert to string for dict key
-        
-        if plot_id_str not in self.plot_points:
-            logging.warning(f"Plot point ID {plot_id} not found. Cannot update status.")
-            return False
             
-        # Add new status to history
+    def _apply_plot_status(self, plot_id_str, new_status, episode_number):
+        self._state_version += 1
         self.plot_points[plot_id_str]["status"] = new_status
         self.plot_points[plot_id_str]["status_history"].append({
             "episode": episode_number,
             "status": new_status
         })
+            
+    def update_character_state(self, character_name, state_change, episode_number):
+        """Update a character's state with a new change"""
+        with self._state_lock:
+            self._apply_char_state(character_name, state_change, episode_number)
+            self._append_event(self._char_log, {"op": "char_state", "name": character_name, "ep": episode_number, "change": state_change})
+        logging.info("Updated character '%s' with new state in episode %s", character_name, episode_number)
+            
+    def add_plot_point(self, summary, status="introduced", episode_added=None):
+        """Add a new plot point/thread to track"""
+        with self._state_lock:
+            self.plot_counter += 1
+            plot_id = self.plot_counter
+            self._apply_plot_add(plot_id, summary, status, episode_added)
+            self._append_event(self._plot_log, {"op": "plot_add", "id": plot_id, "summary": summary, "status": status, "ep": episode_added})
+        logging.info("Added new plot point (ID: %s) in episode %s", plot_id, episode_added)
+        return plot_id
+            
+    def update_plot_status(self, plot_id, new_status, episode_number):
+        """Update a plot point's status"""
+        plot_id_str = str(plot_id)  # Convert to string for dict key
         
-        # Save changes
-        self._save_persistent_data()
-        logging.info(f"Updated plot point (ID: {plot_id}) status to '{new_status}' in episode {episode_number}")
+        with self._state_lock:
+            if plot_id_str not in self.plot_points:
+                logging.warning(f"Plot point ID {plot_id} not found. Cannot update status.")
+                return False
+                
+            # Add new status to history
+            self._apply_plot_status(plot_id_str, new_status, episode_number)
+            self._append_event(self._plot_log, {"op": "plot_status", "id": plot_id, "status": new_status, "ep": episode_number})
+        logging.info("Updated plot point (ID: %s) status to '%s' in episode %s", plot_id, new_status, episode_number)
         return True
             
+    def bulk_update_characters(self, updates):
+        """Apply (character_name, state_change, episode_number) updates under one lock and one log write"""
+        if not updates:
+            return
+        with self._state_lock:
+            events = []
+            for character_name, state_change, episode_number in updates:
+                self._apply_char_state(character_name, state_change, episode_number)
+                events.append({"op": "char_state", "name": character_name, "ep": episode_number, "change": state_change})
+            self._append_events(self._char_log, events)
+        logging.info("Updated %s character states", len(updates))
+            
+    def bulk_add_plot_points(self, plots):
+        """Add (summary, status, episode_added) plot points under one lock and one log write, returning their IDs"""
+        if not plots:
+            return []
+        with self._state_lock:
+            plot_ids, events = [], []
+            for summary, status, episode_added in plots:
+                self.plot_counter += 1
+                plot_id = self.plot_counter
+                self._apply_plot_add(plot_id, summary, status, episode_added)
+                events.append({"op": "plot_add", "id": plot_id, "summary": summary, "status": status, "ep": episode_added})
+                plot_ids.append(plot_id)
+            self._append_events(self._plot_log, events)
+        logging.info("Added %s plot points (IDs %s-%s)", len(plot_ids), plot_ids[0], plot_ids[-1])
+        return plot_ids
+            
+    def bulk_update_plot_status(self, updates):
+        """Apply (plot_id, new_status, episode_number) updates under one lock and one log write.
+
+        Returns the number of plot points updated; unknown IDs are skipped with a warning.
+        """
+        with self._state_lock:
+            events = []
+            for plot_id, new_status, episode_number in updates:
+                plot_id_str = str(plot_id)
+                if plot_id_str not in self.plot_points:
+                    logging.warning(f"Plot point ID {plot_id} not found. Cannot update status.")
+                    continue
+                self._apply_plot_status(plot_id_str, new_status, episode_number)
+                events.append({"op": "plot_status", "id": plot_id, "status": new_status, "ep": episode_number})
+            if events:
+                self._append_events(self._plot_log, events)
+        if events:
+            logging.info("Updated status of %s plot points", len(events))
+        return len(events)
+            
+    def _memoized_summary(self, kind, episode_number, build):
+        """Return a summary string built for the current state version, building it at most once"""
+        with self._state_lock:
+            key = (kind, episode_number, self._state_version)
+            if key not in self._summary_cache:
+                # Entries for older versions can never be hit again
+                if any(cached_key[2] != self._state_version for cached_key in self._summary_cache):
+                    self._summary_cache.clear()
+                self._summary_cache[key] = build()
+            return self._summary_cache[key]
+            
     def get_character_summaries(self):
         """Get summary information for all characters"""
+        return self._memoized_summary("characters", None, self._build_character_summaries)
+        
+    def _build_character_summaries(self):
         summaries = []
         
         for char_name, char_data in self.characters.items():
@@ -226,34 +649,39 @@ class MemoryManager:
             
     def get_context_summary(self, episode_number):
         """Generate a summary of context relevant to a specific episode"""
+        return self._memoized_summary("context", episode_number, lambda: self._build_context_summary(episode_number))
+        
+    def _build_context_summary(self, episode_number):
         # Summarize characters that have appeared before this episode
         character_summary = []
-        for char_name, char_data in self.characters.items():
-            if char_data.get("first_appearance", float("inf")) < episode_number:
-                # Get state changes before this episode
-                relevant_history = [change for change in char_data.get("state_history", [])
-                                  if change.get("episode", float("inf")) < episode_number]
+        char_count = bisect.bisect_left(self._char_first_eps, episode_number)
+        # The index finds who appeared before this episode; they are listed in insertion order
+        for char_name in sorted(self._chars_by_first_appearance[:char_count], key=self._char_order.__getitem__):
+            # Get state changes before this episode
+            relevant_history = [change for change in self.characters[char_name].get("state_history", [])
+                                if _episode_key(change.get("episode")) < episode_number]
+            
+            if relevant_history:
+                last_states = relevant_history[-2:]  # Last 2 states before this episode
+                states_text = "; ".join([f"Episode {change['episode']}: {change['change']}" 
+                                      for change in last_states])
                 
-                if relevant_history:
-                    last_states = relevant_history[-2:]  # Last 2 states before this episode
-                    states_text = "; ".join([f"Episode {change['episode']}: {change['change']}" 
-                                          for change in last_states])
-                    
-                    summary = f"{char_name}: {states_text}"
-                    character_summary.append(summary)
+                summary = f"{char_name}: {states_text}"
+                character_summary.append(summary)
         
         # Summarize active plot points as of the start of this episode
         plot_summary = []
-        for plot_id, plot_data in self.plot_points.items():
-            if plot_data.get("episode_added", float("inf")) < episode_number:
-                # Get status history before this episode
-                relevant_status = [status for status in plot_data.get("status_history", [])
-                                 if status.get("episode", float("inf")) < episode_number]
-                
-                if relevant_status:
-                    latest_status = relevant_status[-1]
-                    summary = f"Plot: {plot_data.get('summary')} - Status as of Episode {latest_status['episode']}: {latest_status['status']}"
-                    plot_summary.append(summary)
+        plot_count = bisect.bisect_left(self._plot_added_eps, episode_number)
+        for plot_id in sorted(self._plots_by_episode_added[:plot_count], key=self._plot_order.__getitem__):
+            plot_data = self.plot_points[plot_id]
+            # Get status history before this episode
+            relevant_status = [status for status in plot_data.get("status_history", [])
+                               if _episode_key(status.get("episode")) < episode_number]
+            
+            if relevant_status:
+                latest_status = relevant_status[-1]
+                summary = f"Plot: {plot_data.get('summary')} - Status as of Episode {latest_status['episode']}: {latest_status['status']}"
+                plot_summary.append(summary)
         
         # Combine summaries
         full_summary = "CHARACTER CONTEXT:\n" + "\n".join(character_summary) if character_summary else "No prior character information."
@@ -268,24 +696,43 @@ class MemoryManager:
             return "No vector store available for retrieving relevant content."
             
         try:
-            results = self.vector_store.similarity_search(query, k=limit)
-            chunks_text = []
-            
-            for i, doc in enumerate(results):
-                # Add metadata about source
-                source_info = f"[From Episode {doc.metadata.get('episode', 'unknown')}"
-                if 'chunk_index' in doc.metadata:
-                    source_info += f", Chunk {doc.metadata['chunk_index']}"
-                source_info += "]"
-                
-                # Format chunk with source info
-                chunks_text.append(f"Relevant Context {i+1} {source_info}:\n{doc.page_content}\n")
-                
-            return "\n".join(chunks_text)
+            return self._format_chunks(self.vector_store.similarity_search(query, k=limit))
+        except Exception as e:
+            logging.error(f"Error retrieving relevant chunks: {e}")
+            return "Error retrieving relevant context."
+            
+    async def aget_relevant_chunks(self, query, limit=5):
+        """Async get_relevant_chunks: awaits the query embedding, then searches on a worker thread"""
+        if not self.vector_store:
+            logging.warning("Vector store not initialized. Cannot retrieve relevant chunks.")
+            return "No vector store available for retrieving relevant content."
+            
+        try:
+            query_vector = await self.embeddings.aembed_query(query)
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, self.vector_store.similarity_search_by_vector, query_vector, limit)
+            return self._format_chunks(results)
         except Exception as e:
             logging.error(f"Error retrieving relevant chunks: {e}")
             return "Error retrieving relevant context."
             
+    @staticmethod
+    def _format_chunks(results):
+        """Render retrieved Documents as numbered context blocks with their source"""
+        chunks_text = []
+        
+        for i, doc in enumerate(results):
+            # Add metadata about source
+            source_info = f"[From Episode {doc.metadata.get('episode', 'unknown')}"
+            if 'chunk_index' in doc.metadata:
+                source_info += f", Chunk {doc.metadata['chunk_index']}"
+            source_info += "]"
+            
+            # Format chunk with source info
+            chunks_text.append(f"Relevant Context {i+1} {source_info}:\n{doc.page_content}\n")
+            
+        return "\n".join(chunks_text)
+        
     def close(self):
         """Close any open connections and save data"""
         if hasattr(self, 'vector_store') and self.vector_store:
@@ -295,40 +742,57 @@ class MemoryManager:
             except Exception as e:
                 logging.error(f"Error persisting vector store: {e}")
                 
-        # Save character and plot data
+        if isinstance(getattr(self, 'embeddings', None), CachedEmbeddings):
+            self.embeddings.close()
+            
+        # Snapshot character and plot data, then make the (now empty) logs durable
         self._save_persistent_data()
+        for log_file in (self._char_log, self._plot_log):
+            if not log_file.closed:
+                log_file.flush()
+                os.fsync(log_file.fileno())
+                log_file.close()
         logging.info("Memory manager closed and data saved.")
         
-    def add_chunks_to_vector_store(self, chunks, episode_number):
-        """Add text chunks to vector store with proper reinitialization if needed"""
+    def stage_scene(self, scene_script, episode_number):
+        """Split and embed a finished scene, holding it until commit_scenes() (safe to call from worker threads).
+
+        Embedding is the slow part, so it overlaps with generating the next scene, while the
+        store only ever receives episodes that were finished.
+        """
+        chunks = [c for c in self.text_splitter.split_text(scene_script) if c and c.strip()]
+        if not chunks:
+            return
+        vectors = self._embed_in_batches(chunks)
+        with self._index_lock:
+            self._staged_scenes.setdefault(episode_number, []).append((chunks, vectors))
+            
+    def commit_scenes(self, episode_number):
+        """Add an episode's staged scenes to the vector store, numbering chunks across the episode"""
+        with self._index_lock:
+            staged = self._staged_scenes.pop(episode_number, [])
+            if not staged:
+                return False
+            chunks = [chunk for scene_chunks, _ in staged for chunk in scene_chunks]
+            vectors = [vector for _, scene_vectors in staged for vector in scene_vectors]
+            return self.add_chunks_to_vector_store(chunks, episode_number, vectors=vectors)
+            
+    def discard_scenes(self, episode_number):
+        """Drop an episode's staged scenes, e.g. when its generation failed"""
+        with self._index_lock:
+            self._staged_scenes.pop(episode_number, None)
+        
+    def add_chunks_to_vector_store(self, chunks, episode_number, vectors=None):
+        """Add text chunks to vector store with proper reinitialization if needed.
+
+        Pass `vectors` when the (non-empty) chunks were already embedded.
+        """
         try:
             # Force re-initialization of vector store if needed
             if not hasattr(self, 'vector_store') or self.vector_store is None:
                 logging.info("Attempting to reinitialize vector store")
-                self.embeddings = OpenAIEmbeddings(openai_api_key=self.api_key)
-                vector_store_path = os.path.join(self.db_path, "vector_store")
-                
-                # Create a fresh directory
-                if os.path.exists(vector_store_path):
-                    import shutil
-                    shutil.rmtree(vector_store_path)
-                
-                os.makedirs(vector_store_path, exist_ok=True)
-                
-                # Create new Chroma instance with explicit client settings
-                from chromadb.config import Settings
-                import chromadb
-                
-                client = chromadb.PersistentClient(
-                    path=vector_store_path,
-                    settings=Settings(anonymized_telemetry=False)
-                )
-                
-                self.vector_store = Chroma(
-                    persist_directory=vector_store_path,
-                    embedding_function=self.embeddings,
-                    client=client
-                )
+                self.embeddings = self._build_embeddings()
+                self.vector_store = self._build_vector_store()
                 
             # Add chunks to vector store (process valid chunks only)
             if chunks and len(chunks) > 0:
@@ -341,11 +805,13 @@ class MemoryManager:
                     for i, _ in enumerate(valid_chunks):
                         metadatas.append({"episode": episode_number, "chunk_index": i, "type": "script_chunk"})
                         
-                    # Add to vector store - with newer versions of Chroma, persistence is automatic 
-                    # when using PersistentClient
-                    self.vector_store.add_texts(texts=valid_chunks, metadatas=metadatas)
-                    # No need to call persist() - it doesn't exist in your version
-                    logging.info(f"Added {len(valid_chunks)} chunks to vector store")
+                    # Embed up front in full-size batches, then hand the store the vectors
+                    # so everything is written in one call
+                    if vectors is None:
+                        vectors = self._embed_in_batches(valid_chunks)
+                    self.vector_store.add_embeddings(valid_chunks, vectors, metadatas)
+                    self.vector_store.persist()
+                    logging.info("Added %s chunks to vector store", len(valid_chunks))
                     return True
                     
             return False
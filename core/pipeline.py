@@ -1,43 +1,101 @@
-﻿import logging
+﻿import asyncio
+import logging
+import os
+import queue
 from core.planner import StoryPlanner
-from core.generator import EpisodicGenerator
+from core.generator import EpisodicGenerator, MAX_CONCURRENT_EPISODES
+from core.episode_store import EpisodeStore
 from core.memory_manager import MemoryManager
 from core.refiner import Refiner
-from utils.config import load_api_key
+from core.response_cache import ResponseCache
+from core.semantic_cache import SemanticCache
+from utils.config import LLM_CACHE_PATH, USE_SCENE_CACHE, load_api_key
+from utils.async_runner import run_sync, submit
+from utils.llm_client import ConcurrentOpenAI
+from utils.logging_config import configure_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Streamed text is handed to the caller in batches of about this many characters (~50 tokens)
+STREAM_BATCH_CHARS = 200
 
 class StoryPipeline:
     """Main pipeline class that orchestrates the story generation process."""
     
-    def __init__(self):
-        """Initialize the pipeline components with API key."""
+    def __init__(self, client=None):
+        """Initialize the pipeline components with API key.
+
+        Pass a `client` from build_client() to share it (and its rate-limit budget and response
+        cache) between pipelines, e.g. across UI sessions. Otherwise the pipeline builds its own.
+        """
+        configure_logging()
         self.api_key = load_api_key()
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Check .env file or environment variables.")
         
+        # One rate-limited client shared by every component so they draw from the same RPM/TPM budget
+        self._owns_client = client is None
+        self.client = client or self.build_client(self.api_key)
+        
         # Initialize components
-        self.planner = StoryPlanner(self.api_key)
-        self.generator = EpisodicGenerator(self.api_key)
-        self.refiner = Refiner(self.api_key)
-        self.memory = MemoryManager(api_key=self.api_key)  # Pass the API key here
+        self.memory = MemoryManager(api_key=self.api_key, client=self.client)  # Pass the API key here
+        self.planner = StoryPlanner(self.api_key, client=self.client)
+        self.generator = EpisodicGenerator(
+            self.api_key,
+            client=self.client,
+            embeddings=getattr(self.memory, "embeddings", None),
+            scene_cache=self._build_scene_cache()
+        )
+        self.refiner = Refiner(self.api_key, client=self.client)
         
         # Store state
         self.story_plan = None
-        self.generated_episodes = {}  # { episode_num: {"script": "", "critique": ""} }
+        self.generated_episodes = EpisodeStore()  # { episode_num: {"script": "", "critique": ""} }, older ones on disk
         
         logging.info("Story Pipeline initialized successfully.")
     
-    def plan_story(self, user_input):
-        """Plan a story based on user input and store in memory."""
+    @staticmethod
+    def build_client(api_key):
+        """Create the rate-limited OpenAI client, with the response cache when it is enabled."""
+        return ConcurrentOpenAI(api_key=api_key, response_cache=StoryPipeline._build_response_cache())
+    
+    @staticmethod
+    def _build_response_cache():
+        """Open the planner / refiner response cache, or None if disabled or unavailable."""
+        if not LLM_CACHE_PATH:
+            return None
+        try:
+            return ResponseCache(LLM_CACHE_PATH)
+        except Exception as e:
+            logging.warning("Response cache disabled: %s", e)
+            return None
+    
+    def _build_scene_cache(self):
+        """Open the semantic scene cache next to the memory store, or None if disabled or unavailable."""
+        if not USE_SCENE_CACHE:
+            return None
+        try:
+            cache_path = os.path.join(self.memory.db_path, f"scene_cache{self.memory.index_suffix()}.sqlite3")
+            return SemanticCache(cache_path, dim=self.memory.embedding_dim)
+        except Exception as e:
+            logging.warning("Scene cache disabled: %s", e)
+            return None
+    
+    def plan_story(self, user_input, bypass_cache=False):
+        """Plan a story based on user input and store in memory. bypass_cache forces a fresh plan."""
         if not user_input:
             logging.error("No user input provided for planning.")
             return False
             
-        self.story_plan = self.planner.generate_initial_plan(user_input)
-        if not self.story_plan:
+        story_plan = self.planner.generate_initial_plan(user_input, bypass_cache=bypass_cache)
+        if not story_plan:
             logging.error("Failed to generate story plan.")
             return False
+        
+        # Re-submitting the same premise replays the cached plan; it is already in memory, and
+        # storing it again would duplicate its characters and plot points
+        if story_plan == self.story_plan:
+            logging.info("Story plan unchanged, keeping the stored plan.")
+            return True
+        self.story_plan = story_plan
             
         # Store plan in memory
         if not self.planner.store_plan(self.story_plan, self.memory):
@@ -47,11 +105,78 @@ class StoryPipeline:
         logging.info("Story plan generated and stored successfully.")
         return True
     
-    def generate_episode(self, episode_number):
-        """Generate a specific episode's script and critique."""
+    def generate_episode(self, episode_number, bypass_cache=False):
+        """Generate a specific episode's script and critique. bypass_cache forces fresh scenes."""
+        return run_sync(self._gen_one(episode_number, bypass_cache=bypass_cache))
+
+    def generate_episode_stream(self, episode_number, bypass_cache=False, batch_chars=STREAM_BATCH_CHARS):
+        """Generate an episode like generate_episode(), yielding the script text as it streams.
+
+        Text is yielded in batches of about `batch_chars` characters. This is the raw model
+        output; once the generator is exhausted the cleaned script and critique are available
+        from get_episode_data() as a new entry. If generation failed, the previous entry (if
+        any) is left as it was.
+        """
+        deltas = queue.Queue()
+        future = submit(self._gen_one(episode_number, bypass_cache=bypass_cache, on_text=deltas.put))
+        future.add_done_callback(lambda _: deltas.put(None))
+        
+        pending, pending_chars = [], 0
+        while True:
+            delta = deltas.get()
+            if delta is None:
+                break
+            pending.append(delta)
+            pending_chars += len(delta)
+            if pending_chars >= batch_chars:
+                yield "".join(pending)
+                pending, pending_chars = [], 0
+        if pending:
+            yield "".join(pending)
+        future.result()  # Re-raise anything the generation task raised
+
+    async def generate_episodes(self, episode_numbers, max_concurrent=MAX_CONCURRENT_EPISODES):
+        """Generate several episodes concurrently. Returns {episode_num: (script, critique)}."""
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def _bounded(episode_number):
+            async with semaphore:
+                return await self._gen_one(episode_number)
+
+        results = await asyncio.gather(*[_bounded(n) for n in episode_numbers])
+        return dict(zip(episode_numbers, results))
+
+    def generate_all_episodes_batch(self, episode_numbers):
+        """Generate several episodes through the OpenAI Batch API at half the cost.
+
+        Each scene round is one batch that may take up to 24h, so this is for offline
+        season runs, not the UI. Returns {episode_num: (script, critique)}.
+        """
+        results, specs = {}, []
+        for episode_number in episode_numbers:
+            inputs = run_sync(self._episode_inputs(episode_number))
+            if isinstance(inputs, str):
+                results[episode_number] = (None, inputs)
+            else:
+                specs.append(inputs)
+        
+        scripts = self.generator.generate_episodes_with_batch_api(specs) if specs else []
+        generated = {}
+        for spec, script in zip(specs, scripts):
+            results[spec["episode_number"]] = run_sync(self._finish_episode(spec["episode_number"], spec["episode_summary"], script, update_memory=False))
+            if script and "Error generating script" not in script:
+                generated[spec["episode_number"]] = script
+        
+        # Memory extraction for every finished script goes out as one more batch
+        if generated:
+            self.refiner.update_memory_batch(generated, self.memory)
+        return results
+
+    async def _episode_inputs(self, episode_number):
+        """Collect the generator inputs for an episode, or return an error message."""
         if not self.story_plan:
             logging.error("No story plan exists. Call plan_story() first.")
-            return None, "No story plan exists."
+            return "No story plan exists."
             
         # Check if episode exists in plan
         episode_in_plan = False
@@ -64,31 +189,44 @@ class StoryPipeline:
                 
         if not episode_in_plan:
             logging.error(f"Episode {episode_number} not found in story plan.")
-            return None, f"Episode {episode_number} not found in story plan."
+            return f"Episode {episode_number} not found in story plan."
         
-        # Get context from memory
-        context_summary = self.memory.get_context_summary(episode_number)
-        character_info = self.memory.get_character_summaries()
-        relevant_chunks = self.memory.get_relevant_chunks(episode_summary, 5)
-        
-        # Generate script
-        script = self.generator.generate_episode_script(
-            episode_number, 
-            episode_summary, 
-            context_summary, 
-            character_info, 
-            relevant_chunks
+        # Get context from memory - the summaries are built on worker threads while the chunk
+        # lookup (embedding round-trip + search) is in flight
+        context_summary, character_info, relevant_chunks = await asyncio.gather(
+            asyncio.to_thread(self.memory.get_context_summary, episode_number),
+            asyncio.to_thread(self.memory.get_character_summaries),
+            self.memory.aget_relevant_chunks(episode_summary, 5)
         )
-        
+        return {
+            "episode_number": episode_number,
+            "episode_summary": episode_summary,
+            "context_summary": context_summary,
+            "character_info": character_info,
+            "relevant_chunks": relevant_chunks,
+        }
+
+    async def _finish_episode(self, episode_number, episode_summary, script, scenes_staged=False, update_memory=True):
+        """Critique a generated script, fold it into memory and store the results.
+
+        Pass update_memory=False when the caller updates memory itself (e.g. in a batch), and
+        scenes_staged=True when the scenes were embedded during generation (stage_scene); they
+        are then added to the vector store only if the episode succeeds.
+        """
         if not script or "Error generating script" in script:
             logging.error(f"Failed to generate script for Episode {episode_number}.")
+            if scenes_staged:
+                self.memory.discard_scenes(episode_number)
             return script, "Generation failed, no critique available."
         
-        # Generate critique - FIX: Pass the memory manager as the fourth argument
-        critique = self.refiner.critique_episode(script, episode_number, episode_summary, self.memory)
-        
-        # Update memory with new content
-        self.refiner.update_memory_from_script(script, episode_number, self.memory)
+        # Critique and update memory concurrently (the staged scenes replace indexing the whole script)
+        if update_memory:
+            critique, _ = await asyncio.gather(
+                self.refiner.process_episode(script, episode_number, episode_summary, self.memory, index_chunks=not scenes_staged),
+                asyncio.to_thread(self.memory.commit_scenes, episode_number) if scenes_staged else asyncio.sleep(0)
+            )
+        else:
+            critique = await self.refiner.acritique_episode(script, episode_number, episode_summary, self.memory)
         
         # Store results
         self.generated_episodes[episode_number] = {
@@ -96,8 +234,31 @@ class StoryPipeline:
             "critique": critique
         }
         
-        logging.info(f"Episode {episode_number} generated and stored.")
+        logging.info("Episode %s generated and stored.", episode_number)
         return script, critique
+
+    async def _gen_one(self, episode_number, bypass_cache=False, on_text=None):
+        """Generate one episode's script and critique on the pipeline event loop."""
+        inputs = await self._episode_inputs(episode_number)
+        if isinstance(inputs, str):
+            return None, inputs
+        
+        # Generate script
+        try:
+            script = await self.generator.generate_episode_script(
+                **inputs,
+                bypass_cache=bypass_cache,
+                scene_indexer=self._stage_scene,
+                on_text=on_text
+            )
+            return await self._finish_episode(episode_number, inputs["episode_summary"], script, scenes_staged=True)
+        finally:
+            # No-op once the scenes were committed; drops them if generation raised
+            self.memory.discard_scenes(episode_number)
+    
+    async def _stage_scene(self, episode_number, scene_script):
+        """Embed a finished scene on a worker thread while the next scene streams."""
+        await asyncio.get_running_loop().run_in_executor(None, self.memory.stage_scene, scene_script, episode_number)
     
     def get_episode_data(self, episode_number):
         """Retrieve data for a specific episode."""
@@ -107,4 +268,8 @@ class StoryPipeline:
         """Close memory connections."""
         if hasattr(self, 'memory') and self.memory:
             self.memory.close()
-            logging.info("Memory connections closed.")
\ No newline at end of file
+            logging.info("Memory connections closed.")
+        if hasattr(self, 'generator') and self.generator.scene_cache:
+            self.generator.scene_cache.close()
+        if hasattr(self, 'client') and self._owns_client and self.client.response_cache:
+            self.client.response_cache.close()
\ No newline at end of file
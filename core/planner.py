@@ -1,69 +1,154 @@
 # core/planner.py
-from openai import OpenAI
+import asyncio
+import hashlib
 import logging
-import json
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
 from utils.config import PLANNER_MODEL, load_api_key
+from utils.async_runner import run_sync
+from utils.llm_client import ConcurrentOpenAI, json_schema_format, stable_seed, strict_object
+
+# Max episode refinements in flight at once
+MAX_CONCURRENT_REFINEMENTS = 8
+
+# Default episode count for testing
+NUM_EPISODES = 5
+
+# Invariant instructions go in the system message, ahead of the per-call input, so repeated
+# calls share a prefix that OpenAI's automatic prompt caching can reuse
+PLANNER_SYSTEM_PREFIX = textwrap.dedent(f"""
+    You are a skilled story planner that organizes stories into episodic formats.
+    You are a story planning assistant that creates well-structured outlines. Return ONLY valid JSON.
+
+    Create a structured story arc for a {NUM_EPISODES}-episode story based on the user's input.
+
+    Format your response as JSON with these components:
+    1. "title": A compelling title for the story
+    2. "premise": A 2-3 sentence summary of the core concept
+    3. "setting": Brief description of where/when the story takes place
+    4. "characters": Array of main characters, each with:
+       - "name": Character name
+       - "description": Brief character description
+       - "motivation": What drives this character
+    5. "master_outline": Array with exactly {NUM_EPISODES} episodes, each containing:
+       - "episode": Episode number (1 to {NUM_EPISODES})
+       - "title": Episode title
+       - "summary": 1-2 paragraph summary of this episode's content
+       - "key_points": Array of 2-3 key plot points or events in this episode
+       - "characters": Array of character names who should appear in this episode
+       - "continuity_notes": Important connections to earlier episodes of this outline
+
+    Create a story that's engaging, has clear character arcs, and resolves by the final episode.
+    The story should work well in audio format.
+
+    IMPORTANT: Return ONLY the valid JSON object.
+    """)
+
+PLANNER_PROMPT_TEMPLATE = 'Story input:\n"{user_input}"\nNumber of episodes: {num_episodes}'
+
+REFINE_PLAN_SYSTEM_PREFIX = textwrap.dedent("""
+    You are a story editor specializing in narrative coherence and continuity.
+    You refine an episode plan using the latest story context.
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    Based on the context, enhance the episode plan to maintain continuity and strengthen the narrative.
+    Return a JSON object with these fields:
+    - "title": Episode title (may be updated)
+    - "summary": Updated episode summary (1-2 paragraphs)
+    - "key_points": Array of 3-5 key events that should happen in this episode
+    - "characters": Array of character names who should appear in this episode
+    - "continuity_notes": Important connections to previous episodes
+
+    IMPORTANT: Return ONLY the valid JSON object.
+    """)
+
+# Deliberately free of the episode number: the request depends only on the plan and the
+# context, so identical refinements share one API call (in flight or from the response cache)
+REFINE_PLAN_TEMPLATE = textwrap.dedent("""
+    ORIGINAL EPISODE PLAN:
+    Title: {title}
+    Summary: {summary}
+    Key Points: {key_points}
+
+    CURRENT STORY CONTEXT (from previous episodes):
+    {context}
+    """)
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# Structured Outputs schemas - the model can only emit JSON of these shapes
+PLAN_SCHEMA = strict_object({
+    "title": {"type": "string"},
+    "premise": {"type": "string"},
+    "setting": {"type": "string"},
+    "characters": {"type": "array", "items": strict_object({
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "motivation": {"type": "string"},
+    })},
+    "master_outline": {"type": "array", "items": strict_object({
+        "episode": {"type": "integer"},
+        "title": {"type": "string"},
+        "summary": {"type": "string"},
+        "key_points": _STRING_LIST,
+        "characters": _STRING_LIST,
+        "continuity_notes": {"type": "string"},
+    })},
+})
+REFINED_EPISODE_SCHEMA = strict_object({
+    "title": {"type": "string"},
+    "summary": {"type": "string"},
+    "key_points": _STRING_LIST,
+    "characters": _STRING_LIST,
+    "continuity_notes": {"type": "string"},
+})
+PLAN_RESPONSE_FORMAT = json_schema_format("story_plan", PLAN_SCHEMA)
+REFINE_RESPONSE_FORMAT = json_schema_format("refined_episode", REFINED_EPISODE_SCHEMA)
+
+def _context_digest(context):
+    """Stable fingerprint of a memory context, to tell whether it changed since planning"""
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()
 
 class StoryPlanner:
     """Creates story outlines and episode plans based on user input"""
     
-    def __init__(self, api_key):
-        """Initialize with API key for language model access"""
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, client=None):
+        """Initialize with API key (or a shared client) for language model access"""
+        self.client = client or ConcurrentOpenAI(api_key=api_key)
         self.model = PLANNER_MODEL  # Using the more capable model for planning
+        # Digest of each episode's memory context when the plan was stored; refining against
+        # the same context would only repeat the initial plan, so it is skipped
+        self._planning_contexts = {}
         
-    def generate_initial_plan(self, user_input):
-        """Generate a complete story plan from user input"""
+    def generate_initial_plan(self, user_input, bypass_cache=False):
+        """Generate a complete story plan from user input. bypass_cache forces a fresh plan."""
         logging.info("Generating initial story plan from user input")
         
-        num_episodes = 5  # Default episode count for testing
-        prompt = f"""
-        You are a skilled story planner that organizes stories into episodic formats.
-        
-        Create a structured story arc for a {num_episodes}-episode story based on this input:
-        "{user_input}"
-        
-        Format your response as JSON with these components:
-        1. "title": A compelling title for the story 
-        2. "premise": A 2-3 sentence summary of the core concept
-        3. "setting": Brief description of where/when the story takes place
-        4. "characters": Array of main characters, each with:
-           - "name": Character name
-           - "description": Brief character description
-           - "motivation": What drives this character
-        5. "master_outline": Array with exactly {num_episodes} episodes, each containing:
-           - "episode": Episode number (1 to {num_episodes})
-           - "title": Episode title
-           - "summary": 1-2 paragraph summary of this episode's content
-           - "key_points": Array of 2-3 key plot points or events in this episode
+        prompt = PLANNER_PROMPT_TEMPLATE.format(user_input=user_input, num_episodes=NUM_EPISODES)
         
-        Create a story that's engaging, has clear character arcs, and resolves by the final episode.
-        The story should work well in audio format.
-        
-        IMPORTANT: Return ONLY the valid JSON object.
-        """
+        request = dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": PLANNER_SYSTEM_PREFIX},
+                {"role": "user", "content": prompt}
+            ],
+            # Schema-constrained output, always parses as a plan
+            response_format=PLAN_RESPONSE_FORMAT,
+            temperature=0.7,
+            extra_body={"prompt_cache_key": "story-planner"}
+        )
+        if not bypass_cache:
+            # Same input, same plan (and a response cache hit). Re-rolls go unseeded.
+            request["seed"] = stable_seed(user_input)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a story planning assistant that creates well-structured outlines. Return ONLY valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                # Adding json format explicitly
-                response_format={"type": "json_object"},
-                temperature=0.7
-            )
-            
-            # Get the content of the response
-            plan_json = response.choices[0].message.content
+            plan_json = self.client.chat_text(bypass_cache=bypass_cache, **request)
             
             # Debug logging - see what we received
-            logging.info(f"Received response from OpenAI. Content length: {len(plan_json)}")
+            logging.info("Received response from OpenAI. Content length: %s", len(plan_json))
             if len(plan_json) < 100:  # If it's suspiciously short, log the entire content
-                logging.info(f"Response content: {plan_json}")
+                logging.info("Response content: %s", plan_json)
             
             # Ensure we have content before trying to parse
             if not plan_json or len(plan_json.strip()) == 0:
@@ -72,10 +157,10 @@ class StoryPlanner:
                 
             # Parse the JSON
             try:
-                plan = json.loads(plan_json)
-                logging.info(f"Generated story plan: '{plan.get('title', 'Untitled')}' with {len(plan.get('master_outline', []))} episodes")
+                plan = orjson.loads(plan_json)
+                logging.info("Generated story plan: '%s' with %s episodes", plan.get('title', 'Untitled'), len(plan.get('master_outline', [])))
                 return plan
-            except json.JSONDecodeError as je:
+            except orjson.JSONDecodeError as je:
                 # More detailed JSON error logging
                 logging.error(f"JSON decode error: {je}")
                 logging.error(f"First 200 chars of content: {plan_json[:200]}")
@@ -85,49 +170,92 @@ class StoryPlanner:
             logging.error(f"Error generating story plan: {e}")
             return None
             
-    def refine_episode_plan(self, episode_number, episode_plan, context_from_memory):
+    def refine_episode_plan(self, episode_number, episode_plan, context_from_memory, bypass_cache=False):
         """Refine a specific episode plan based on context from previous episodes"""
-        logging.info(f"Refining plan for Episode {episode_number} with up-to-date context")
+        return run_sync(self.arefine_episode_plan(episode_number, episode_plan, context_from_memory, bypass_cache))
         
-        prompt = f"""
-        You are a story editor refining an episode plan using the latest story context.
+    async def refine_all_episode_plans(self, episode_plans, contexts, max_concurrent=MAX_CONCURRENT_REFINEMENTS):
+        """Refine several episode plans concurrently.
         
-        EPISODE TO REFINE: Episode {episode_number}
+        episode_plans are master_outline entries (with an "episode" number) and contexts the
+        matching memory contexts. Returns the refined plans in order, None where refining failed.
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
         
-        ORIGINAL EPISODE PLAN:
-        Title: {episode_plan.get('title')}
-        Summary: {episode_plan.get('summary')}
-        Key Points: {', '.join(episode_plan.get('key_points', []))}
+        async def _bounded(episode_plan, context):
+            async with semaphore:
+                return await self.arefine_episode_plan(episode_plan.get("episode"), episode_plan, context)
+                
+        results = await asyncio.gather(*[_bounded(plan, context) for plan, context in zip(episode_plans, contexts)],
+                                       return_exceptions=True)
+        return [None if isinstance(result, Exception) else result for result in results]
         
-        CURRENT STORY CONTEXT (from previous episodes):
-        {context_from_memory}
+    def _unchanged_since_planning(self, episode_number, episode_plan, context_from_memory):
+        """True when refining would only repeat the initial plan, which already carries the refined fields"""
+        if ("continuity_notes" in episode_plan
+                and self._planning_contexts.get(episode_number) == _context_digest(context_from_memory)):
+            logging.info("Context for Episode %s unchanged since planning, keeping the initial plan", episode_number)
+            return True
+        return False
         
-        Based on this context, enhance the episode plan to maintain continuity and strengthen the narrative.
-        Return a JSON object with these fields:
-        - "title": Episode title (may be updated)
-        - "summary": Updated episode summary (1-2 paragraphs)
-        - "key_points": Array of 3-5 key events that should happen in this episode
-        - "characters": Array of character names who should appear in this episode
-        - "continuity_notes": Important connections to previous episodes
+    def _refine_request(self, episode_plan, context_from_memory):
+        """chat.completions.create() kwargs for refining one episode plan, keyed only by its content"""
+        prompt = REFINE_PLAN_TEMPLATE.format(
+            title=episode_plan.get('title'),
+            summary=episode_plan.get('summary'),
+            key_points=', '.join(episode_plan.get('key_points', [])),
+            context=context_from_memory
+        )
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": REFINE_PLAN_SYSTEM_PREFIX},
+                {"role": "user", "content": prompt}
+            ],
+            "response_format": REFINE_RESPONSE_FORMAT,
+            "temperature": 0.5,
+            "seed": stable_seed(prompt),
+            "extra_body": {"prompt_cache_key": "episode-refiner"}
+        }
         
-        IMPORTANT: Return ONLY the valid JSON object.
+    def refine_episode_plans_batch(self, episode_plans, contexts):
+        """Refine several episode plans with one Batch API job (half price, results within 24h).
+        
+        Same inputs and output as refine_all_episode_plans, for offline runs.
         """
+        refined, requests = [], {}
+        for episode_plan, context in zip(episode_plans, contexts):
+            episode_number = episode_plan.get("episode")
+            if self._unchanged_since_planning(episode_number, episode_plan, context):
+                refined.append(episode_plan)
+            else:
+                refined.append(None)
+                requests[f"ep{episode_number}"] = self._refine_request(episode_plan, context)
+        
+        results = self.client.run_batch(requests) if requests else {}
+        for i, episode_plan in enumerate(episode_plans):
+            body = results.get(f"ep{episode_plan.get('episode')}")
+            if refined[i] is not None or body is None:
+                continue
+            try:
+                refined[i] = orjson.loads(body["choices"][0]["message"]["content"])
+            except (orjson.JSONDecodeError, TypeError) as e:
+                logging.error("Error decoding batch refinement for Episode %s: %s", episode_plan.get("episode"), e)
+        return refined
+        
+    async def arefine_episode_plan(self, episode_number, episode_plan, context_from_memory, bypass_cache=False):
+        """Async refine_episode_plan, for running many refinements at once"""
+        if self._unchanged_since_planning(episode_number, episode_plan, context_from_memory):
+            return episode_plan
+            
+        logging.info("Refining plan for Episode %s with up-to-date context", episode_number)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a story editor specializing in narrative coherence and continuity."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.5
-            )
-            
-            refined_json = response.choices[0].message.content
-            refined_plan = json.loads(refined_json)
-            
-            logging.info(f"Successfully refined plan for Episode {episode_number}")
+            refined_json = await self.client.achat_text(bypass_cache=bypass_cache, **self._refine_request(episode_plan, context_from_memory))
+            
+            refined_plan = orjson.loads(refined_json)
+            
+            logging.info("Successfully refined plan for Episode %s", episode_number)
             return refined_plan
             
         except Exception as e:
@@ -143,34 +271,8 @@ class StoryPlanner:
             return False
             
         try:
-            # Store characters
-            for character in story_plan.get('characters', []):
-                memory_manager.update_character_state(
-                    character.get('name', 'Unknown'),
-                    f"Description: {character.get('description', '')}. Motivation: {character.get('motivation', '')}",
-                    0  # Episode 0 means "initial planning"
-                )
-            
-            # Store initial plot points from episode outlines
-            for episode in story_plan.get('master_outline', []):
-                # Store episode objective as a plot point
-                plot_summary = f"Episode {episode.get('episode')} objective: {episode.get('summary')}"
-                memory_manager.add_plot_point(
-                    plot_summary,
-                    status="planned",
-                    episode_added=0  # Episode 0 means "initial planning"
-                )
-                
-                # Store key points as individual plot points
-                for point in episode.get('key_points', []):
-                    plot_summary = f"Episode {episode.get('episode')} key point: {point}"
-                    memory_manager.add_plot_point(
-                        plot_summary,
-                        status="planned",
-                        episode_added=0  # Episode 0 means "initial planning"
-                    )
-            
-            # Store the story premise and setting as a document
+            # Store the story premise and setting as a document. Embedding it is a network
+            # round-trip, so it runs in the background while the characters and plots are written
             overview_text = f"""
             STORY TITLE: {story_plan.get('title', 'Untitled')}
             
@@ -179,10 +281,35 @@ class StoryPlanner:
             SETTING: {story_plan.get('setting', 'No setting specified')}
             """
             
-            memory_manager.add_document_chunks(
-                overview_text,
-                metadata={"type": "story_overview", "episode": 0}
-            )
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                overview_stored = pool.submit(
+                    memory_manager.add_document_chunks,
+                    overview_text,
+                    metadata={"type": "story_overview", "episode": 0}
+                )
+                
+                # Store characters (episode 0 means "initial planning")
+                memory_manager.bulk_update_characters([
+                    (character.get('name', 'Unknown'),
+                     f"Description: {character.get('description', '')}. Motivation: {character.get('motivation', '')}",
+                     0)
+                    for character in story_plan.get('characters', [])
+                ])
+                
+                # Store each episode objective and its key points as planned plot points
+                plots = []
+                for episode in story_plan.get('master_outline', []):
+                    plots.append((f"Episode {episode.get('episode')} objective: {episode.get('summary')}", "planned", 0))
+                    plots.extend((f"Episode {episode.get('episode')} key point: {point}", "planned", 0)
+                                 for point in episode.get('key_points', []))
+                memory_manager.bulk_add_plot_points(plots)
+                
+                overview_stored.result()
+            
+            self._planning_contexts = {
+                episode.get('episode'): _context_digest(memory_manager.get_context_summary(episode.get('episode')))
+                for episode in story_plan.get('master_outline', [])
+            }
             
             logging.info("Story plan successfully stored in memory")
             return True
@@ -1,121 +1,295 @@
 # core/refiner.py
-from openai import OpenAI
-import json
+import asyncio
 import logging
+import re
+import textwrap
+
+import orjson
 from utils.config import REFINER_MODEL, UPDATER_MODEL, load_api_key
+from utils.async_runner import run_sync
+from utils.llm_client import ConcurrentOpenAI, json_schema_format, strict_object
 from core.memory_manager import MemoryManager # Type hinting
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Invariant instructions go in the system message, ahead of the per-episode script, so repeated
+# calls share a prefix that OpenAI's automatic prompt caching can reuse
+CRITIQUE_SYSTEM_PREFIX = textwrap.dedent("""
+    You are a meticulous script editor focused on continuity and consistency.
+    You review draft episode scripts against the established story context.
 
-class Refiner:
-    def __init__(self, api_key):
-        self.client = OpenAI(api_key=api_key)
-        self.refiner_model = REFINER_MODEL
-        self.updater_model = UPDATER_MODEL # Use potentially cheaper model for extraction
+    Please evaluate the script based on these criteria:
+    1. **Continuity**: Does the script contradict established facts from the context (character knowledge, location, plot statuses)? Point out specific inconsistencies if any.
+    2. **Consistency**: Are character actions and dialogue consistent with their established personalities and motivations (as described in the context)?
+    3. **Plot Advancement**: Does the script meaningfully advance the plot towards the stated Episode Goal?
+    4. **Pacing/Engagement**: (Optional) Briefly comment on the pacing or if the script feels engaging.
 
-    def critique_episode(self, script_text, episode_number, episode_summary, memory_manager: MemoryManager):
-        """Reviews the generated script using an LLM as a critic."""
-        logging.info(f"--- Reviewing Script for Episode {episode_number} ---")
+    Provide concise feedback. Start with an overall assessment (e.g., "Looks good", "Minor issues found", "Major inconsistencies"). Then list specific points if necessary.
+    """)
 
-        # Retrieve relevant context for the critic
-        context_summary = memory_manager.get_context_summary(episode_number) # Get state *before* this ep
-        # Maybe retrieve specific plot points mentioned
+CRITIQUE_TEMPLATE = textwrap.dedent("""
+    Review the following draft script for Episode {episode_number}.
+
+    Episode Goal/Summary: {episode_summary}
+
+    Established Context (Characters, Active Plots before this episode):
+    {context_summary}
+
+    Script Draft:
+    --- START SCRIPT ---
+    {script_text}
+    --- END SCRIPT ---
+    """)
+
+EXTRACTION_SYSTEM_PREFIX = textwrap.dedent("""
+    You are an AI assistant extracting structured data from scripts. Output *only* valid JSON.
+    Analyze the script segment you are given and extract key information updates as a valid JSON object.
+
+    Identify the following and structure them in JSON:
+    -"character_updates": (Array of Objects) List characters whose state changed significantly. Include:
+        - "name": (String) Character name
+        - "state_change": (String) Description of the new state
+    -"plot_updates": (Array of Objects) List existing plot points (by summary or ID if known) whose status changed.
+    - "new_plot_points": (Array of Strings) List summaries of any *new* major plot threads or quests introduced
+    - "key_event_summary": (String) A brief (1-2 sentence) summary of what appears to be happening in this episode.
+
+    If no updates are found for a category, provide an empty array [].
+    Output *only* the valid JSON object.
+    """)
+
+EXTRACTION_TEMPLATE = textwrap.dedent("""
+    This is the first part of the script for Episode {episode_number}.
 
-        prompt = f"""
-        You are a script editor reviewing the following draft script for Episode {episode_number}.
+    Script Text (First Segment):
+    --- START SCRIPT ---
+    {script_text}
+    --- END SCRIPT ---
+    """)
 
-        Episode Goal/Summary: {episode_summary}
+# Structured Outputs schema for the extraction call - the model can only emit JSON of this shape
+EXTRACTION_SCHEMA = strict_object({
+    "character_updates": {"type": "array", "items": strict_object({
+        "name": {"type": "string"},
+        "state_change": {"type": "string"},
+    })},
+    "plot_updates": {"type": "array", "items": strict_object({
+        "plot_summary_or_id": {"anyOf": [{"type": "integer"}, {"type": "string"}]},
+        "new_status": {"type": "string"},
+    })},
+    "new_plot_points": {"type": "array", "items": {"type": "string"}},
+    "key_event_summary": {"type": "string"},
+})
+EXTRACTION_RESPONSE_FORMAT = json_schema_format("memory_extraction", EXTRACTION_SCHEMA)
 
-        Established Context (Characters, Active Plots before this episode):
-        {context_summary}
+# Characters of script the extraction segment is taken from
+EXTRACTION_HEAD_CHARS = 4000
 
-        Script Draft:
-        --- START SCRIPT ---
-        {script_text}
-        --- END SCRIPT ---
+# The distilled script is only sent when it is at most this fraction of the original segment
+DISTILL_MAX_RATIO = 0.3
+SCENE_HEADING_RE = re.compile(r"^\s*(SCENE|INT\.|EXT\.)")
+# First words that are no use as a short alias ("The Stranger", "Dr. X") - they match nearly every block
+ALIAS_STOP_WORDS = frozenset({
+    "the", "a", "an", "and", "of", "mr", "mrs", "ms", "miss", "dr", "sir", "lady", "lord",
+    "captain", "professor", "agent", "officer", "detective", "king", "queen", "prince",
+    "princess", "old", "young", "little", "big",
+})
 
-        Please evaluate the script based on these criteria:
-        1. **Continuity**: Does the script contradict established facts from the context (character knowledge, location, plot statuses)? Point out specific inconsistencies if any.
-        2. **Consistency**: Are character actions and dialogue consistent with their established personalities and motivations (as described in the context)?
-        3. **Plot Advancement**: Does the script meaningfully advance the plot towards the stated Episode Goal?
-        4. **Pacing/Engagement**: (Optional) Briefly comment on the pacing or if the script feels engaging.
+def _distill_for_extraction(script_text, known_names):
+    """Keep only the screenplay blocks that open a scene or mention a character already in memory.
 
-        Provide concise feedback. Start with an overall assessment (e.g., "Looks good", "Minor issues found", "Major inconsistencies"). Then list specific points if necessary.
+    Blocks are blank-line separated, so a dialogue block is kept whole when its cue names a
+    known character. Names also match on their first word ("ALICE" for "Alice Moreau"), unless
+    that word is a title, an article or shorter than 3 characters.
+    """
+    patterns = set()
+    for name in known_names:
+        parts = name.split() if name else []
+        if not parts:
+            continue
+        patterns.add(re.escape(" ".join(parts)))
+        alias = parts[0].rstrip(".")
+        if len(alias) >= 3 and alias.lower() not in ALIAS_STOP_WORDS:
+            patterns.add(re.escape(alias))
+    if not patterns:
+        return script_text
+    # One alternation scans each block once however many names there are
+    names_re = re.compile(r"\b(?:" + "|".join(sorted(patterns, key=len, reverse=True)) + r")\b", re.IGNORECASE)
+    blocks = re.split(r"\n\s*\n", script_text)
+    return "\n\n".join(block for block in blocks if SCENE_HEADING_RE.match(block) or names_re.search(block))
+
+class Refiner:
+    def __init__(self, api_key, client=None):
+        self.client = client or ConcurrentOpenAI(api_key=api_key)
+        self.refiner_model = REFINER_MODEL
+        self.updater_model = UPDATER_MODEL # Use potentially cheaper model for extraction
+
+    async def process_episode(self, script_text, episode_number, episode_summary, memory_manager: MemoryManager, index_chunks=True, bypass_cache=False):
+        """Critique a script and fold it into memory concurrently. Returns the critique.
+
+        Neither call needs the other's output. The critique is started first, so it reads the
+        pre-episode context before the memory update (which writes only after its extraction
+        call returns) changes it.
         """
+        critique, _ = await asyncio.gather(
+            self.acritique_episode(script_text, episode_number, episode_summary, memory_manager, bypass_cache),
+            self.aupdate_memory_from_script(script_text, episode_number, memory_manager, index_chunks, bypass_cache)
+        )
+        return critique
+
+    def critique_episode(self, script_text, episode_number, episode_summary, memory_manager: MemoryManager, bypass_cache=False):
+        """Reviews the generated script using an LLM as a critic. Returns the critique text."""
+        return run_sync(self.acritique_episode(script_text, episode_number, episode_summary, memory_manager, bypass_cache))
+
+    async def acritique_episode(self, script_text, episode_number, episode_summary, memory_manager: MemoryManager, bypass_cache=False):
+        """Async critique_episode"""
+        logging.info("--- Reviewing Script for Episode %s ---", episode_number)
+
+        # Retrieve relevant context for the critic
+        context_summary = memory_manager.get_context_summary(episode_number) # Get state *before* this ep
+        # Maybe retrieve specific plot points mentioned
+
+        prompt = CRITIQUE_TEMPLATE.format(
+            episode_number=episode_number,
+            episode_summary=episode_summary,
+            context_summary=context_summary,
+            script_text=script_text
+        )
 
         try:
-            response = self.client.chat.completions.create(
+            critique = await self.client.achat_text(
+                bypass_cache=bypass_cache,
                 model=self.refiner_model,
                 messages=[
-                    {"role": "system", "content": "You are a meticulous script editor focused on continuity and consistency."},
+                    {"role": "system", "content": CRITIQUE_SYSTEM_PREFIX},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3, # Low temp for analytical tasks
-                max_tokens=500
+                temperature=0, # Deterministic for analytical tasks
+                seed=episode_number,
+                max_tokens=500,
+                extra_body={"prompt_cache_key": "script-critique"}
             )
-            critique = response.choices[0].message.content
-            logging.info(f"--- Critique for Episode {episode_number} ---\n{critique}\n-----------------")
+            logging.info("--- Critique for Episode %s ---\n%s\n-----------------", episode_number, critique)
             # In a more advanced system, you could parse this critique and trigger revisions
-            # For now, we just return the critique alongside the original script.
-            return script_text, critique # Return original script + critique
+            return critique
 
         except Exception as e:
             logging.error(f"Error calling OpenAI for script review (Episode {episode_number}):{e}", exc_info=True)
-            return script_text, "Error generating critique." # Return original script + error message
-
-    def update_memory_from_script(self, script_text, episode_number, memory_manager: MemoryManager):
-        """Parses script, extracts info using LLM (JSON), and updates memory."""
-        logging.info(f"--- Updating Memory from Episode {episode_number} Script ---")
+            return "Error generating critique."
 
-        # 1. Chunk the script for analysis and RAG storage
-        script_chunks = memory_manager.text_splitter.split_text(script_text)
-        logging.info(f"Split script into {len(script_chunks)} chunks for analysis and storage.")
-
-        # 2. Extract Structured Information using LLM (JSON mode)
+    def _extraction_request(self, script_text, script_chunks, episode_number, known_names=()):
+        """chat.completions.create() kwargs for extracting memory updates from a script"""
         # Process the first chunk or a summary instead of the whole script
         # This prevents token limit issues
+        script_for_analysis = script_chunks[0] if script_chunks else script_text[:EXTRACTION_HEAD_CHARS]
         
-        # Create a summary or use first part of script
-        script_for_analysis = script_chunks[0] if script_chunks else script_text[:4000]
-        
-        extraction_prompt = f"""
-        Analyze the first part of the script for Episode {episode_number}. Extract key information updates as a valid JSON object.
+        # Send only the parts about known characters when that cuts the prompt substantially
+        distilled = _distill_for_extraction(script_for_analysis, known_names)
+        if distilled and len(distilled) <= DISTILL_MAX_RATIO * len(script_for_analysis):
+            script_for_analysis = distilled
         
-        Script Text (First Segment):
-        --- START SCRIPT ---
-        {script_for_analysis}
-        --- END SCRIPT ---
-        
-        Identify the following and structure them in JSON:
-        -"character_updates": (Array of Objects) List characters whose state changed significantly. Include:
-            - "name": (String) Character name
-            - "state_change": (String) Description of the new state
-        -"plot_updates": (Array of Objects) List existing plot points (by summary or ID if known) whose status changed.
-        - "new_plot_points": (Array of Strings) List summaries of any *new* major plot threads or quests introduced
-        - "key_event_summary": (String) A brief (1-2 sentence) summary of what appears to be happening in this episode.
-        
-        If no updates are found for a category, provide an empty array [].
-        Output *only* the valid JSON object.
+        extraction_prompt = EXTRACTION_TEMPLATE.format(episode_number=episode_number, script_text=script_for_analysis)
+        return {
+            "model": self.updater_model, # Use potentially cheaper model
+            "messages": [
+                {"role": "system", "content": EXTRACTION_SYSTEM_PREFIX},
+                {"role": "user", "content": extraction_prompt}
+            ],
+            "response_format": EXTRACTION_RESPONSE_FORMAT,
+            "temperature": 0, # Extraction needs no sampling variety
+            "seed": episode_number,
+            "max_tokens": 800,  # Schema output carries no filler; this only guards runaway lists
+            "extra_body": {"prompt_cache_key": "memory-extraction"}
+        }
+
+    def _apply_extracted_info(self, extracted_info, episode_number, memory_manager):
+        """Write extracted character / plot updates to memory (one bulk call per category)"""
+        # Update characters
+        memory_manager.bulk_update_characters([
+            (update.get("name"), update.get("state_change"), episode_number)
+            for update in extracted_info.get("character_updates", [])
+        ])
+
+        # Update existing plot points
+        status_updates = []
+        for update in extracted_info.get("plot_updates", []):
+            plot_id = update.get("plot_summary_or_id")
+            new_status = update.get("new_status")
+            if isinstance(plot_id, int): # If LLM correctly identified an ID
+                status_updates.append((plot_id, new_status, episode_number))
+            elif isinstance(plot_id, str):
+                # TODO: Need a way to map summary back to ID reliably
+                logging.warning(f"Plot update provided summary '{plot_id}' instead of ID. Mapping not implemented. Status not updated.")
+        memory_manager.bulk_update_plot_status(status_updates)
+
+        # Add new plot points
+        memory_manager.bulk_add_plot_points([
+            (summary, "introduced", episode_number)
+            for summary in extracted_info.get("new_plot_points", [])
+        ])
+
+    def update_memory_batch(self, scripts, memory_manager: MemoryManager, index_chunks=True):
+        """Update memory from several episode scripts with one Batch API job (half price, up to 24h).
+
+        `scripts` maps episode number -> script text. Meant for offline runs; updates are
+        applied in episode order once the batch finishes.
         """
-        
+        episodes = sorted(scripts)
+        known_names = list(memory_manager.characters)
+        chunks = {episode_number: memory_manager.text_splitter.split_text(scripts[episode_number]) for episode_number in episodes}
+        requests = {
+            f"ep{episode_number}": self._extraction_request(scripts[episode_number], chunks[episode_number], episode_number, known_names)
+            for episode_number in episodes
+        }
+        results = self.client.run_batch(requests)
+
+        for episode_number in episodes:
+            body = results.get(f"ep{episode_number}")
+            if body is None:
+                logging.error("Batch memory extraction failed for Episode %s. Skipping structured updates.", episode_number)
+            else:
+                try:
+                    self._apply_extracted_info(orjson.loads(body["choices"][0]["message"]["content"]), episode_number, memory_manager)
+                except (orjson.JSONDecodeError, TypeError) as e:
+                    logging.error("Failed to decode batch extraction JSON for Episode %s: %s", episode_number, e)
+            if index_chunks:
+                memory_manager.add_chunks_to_vector_store(chunks[episode_number], episode_number)
+
+        logging.info("Batch memory update for %s episode(s) complete.", len(episodes))
+
+    @staticmethod
+    def _index_script(script_text, episode_number, memory_manager):
+        """Split a whole script into chunks and add them to the vector store"""
+        script_chunks = memory_manager.text_splitter.split_text(script_text)
+        logging.info("Split script into %s chunks for storage.", len(script_chunks))
+        return memory_manager.add_chunks_to_vector_store(script_chunks, episode_number)
+
+    def update_memory_from_script(self, script_text, episode_number, memory_manager: MemoryManager, index_chunks=True, bypass_cache=False):
+        """Parses script, extracts info using LLM (JSON), and updates memory.
+
+        Pass index_chunks=False when the scenes were already indexed while generating.
+        """
+        return run_sync(self.aupdate_memory_from_script(script_text, episode_number, memory_manager, index_chunks, bypass_cache))
+
+    async def aupdate_memory_from_script(self, script_text, episode_number, memory_manager: MemoryManager, index_chunks=True, bypass_cache=False):
+        """Async update_memory_from_script"""
+        logging.info("--- Updating Memory from Episode %s Script ---", episode_number)
+
+        # 1. Chunk the script. The extraction only reads the first segment, so that is split from
+        # the head of the script right away. Splitting the whole script for RAG storage and
+        # embedding the chunks run on a worker thread while the extraction request is in flight.
+        head_chunks = memory_manager.text_splitter.split_text(script_text[:EXTRACTION_HEAD_CHARS])
+        indexing = None
+        if index_chunks:
+            indexing = asyncio.get_running_loop().run_in_executor(None, self._index_script, script_text, episode_number, memory_manager)
+
+        # 2. Extract Structured Information using LLM (JSON mode)
         extracted_info = None
+        info_json_str = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.updater_model, # Use potentially cheaper model
-                messages=[
-                    {"role": "system", "content": "You are an AI assistant extracting structured data from scripts. Output *only* valid JSON."},
-                    {"role": "user", "content": extraction_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.1, # Low temp for extraction
-                max_tokens=1500  # Adjust based on script length
-            )
-            info_json_str = response.choices[0].message.content
-            extracted_info = json.loads(info_json_str)
-            logging.info(f"Successfully extracted information JSON from script Ep {episode_number}.")
-            # logging.debug(f"Extracted Info: {json.dumps(extracted_info, indent=2)}")
+            info_json_str = await self.client.achat_text(bypass_cache=bypass_cache, **self._extraction_request(script_text, head_chunks, episode_number, list(memory_manager.characters)))
+            extracted_info = orjson.loads(info_json_str)
+            logging.info("Successfully extracted information JSON from script Ep %s.", episode_number)
+            logging.debug("Extracted Info: %s", extracted_info)  # Only formatted when DEBUG is on
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logging.error(f"Failed to decode JSON response during memory update extraction: {e}")
             logging.error(f"Received text: {info_json_str}")
             # Continue without structured updates, but log error
@@ -125,32 +299,10 @@ class Refiner:
 
         # 3. Update Databases based on extracted info
         if extracted_info:
-            # Update characters
-            for update in extracted_info.get("character_updates", []):
-                memory_manager.update_character_state(update.get("name"), update.get("state_change"), episode_number)
-
-            # Update existing plot points
-            for update in extracted_info.get("plot_updates", []):
-                plot_id = update.get("plot_summary_or_id")
-                new_status = update.get("new_status")
-                if isinstance(plot_id, int): # If LLM correctly identified an ID
-                    memory_manager.update_plot_status(plot_id, new_status, episode_number)
-                elif isinstance(plot_id, str):
-                    # TODO: Need a way to map summary back to ID reliably
-                    logging.warning(f"Plot update provided summary '{plot_id}' instead of ID. Mapping not implemented. Status not updated.")
-                    pass # Add logic here if needed
-
-            # Add new plot points
-            for summary in extracted_info.get("new_plot_points", []):
-                memory_manager.add_plot_point(summary, episode_added=episode_number)
-
-        # 4. Add Script Chunks to Vector Store for RAG
-        base_metadata = {"episode": episode_number, "type": "script_chunk"}
-        if extracted_info and extracted_info.get("key_event_summary"):
-            # Add summary to metadata of all chunks, or just first/last
-            base_metadata["ep_key_event_summary"] = extracted_info["key_event_summary"]
-
-        # Use the specialized method that handles reinit
-        memory_manager.add_chunks_to_vector_store(script_chunks, episode_number)
-
-        logging.info(f"Memory update process for Episode {episode_number} complete.")
\ No newline at end of file
+            self._apply_extracted_info(extracted_info, episode_number, memory_manager)
+
+        # 4. Wait for the script chunks to land in the vector store
+        if indexing:
+            await indexing
+
+        logging.info("Memory update process for Episode %s complete.", episode_number)
\ No newline at end of file
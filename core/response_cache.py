@@ -0,0 +1,58 @@
+# core/response_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Least recently used responses beyond this count are evicted
+DEFAULT_MAX_ENTRIES = 10000
+
+class ResponseCache:
+    """Persistent LRU cache of chat completion texts, keyed by the full request.
+
+    The key is sha256 over the request arguments (model, messages, temperature, ...), so a
+    hit only happens for an identical request - e.g. re-running planning or critique on
+    unchanged inputs during development.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_ts ON responses (ts)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        logging.info("Response cache opened at %s", db_path)
+
+    @staticmethod
+    def key_for(request_kwargs):
+        payload = json.dumps(request_kwargs, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached text for `key` (marking it recently used), or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET ts = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, key, content):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, content, ts) VALUES (?, ?, ?)", (key, content, time.time()))
+            self._conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY ts DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
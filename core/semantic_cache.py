@@ -0,0 +1,98 @@
+# core/semantic_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import sqlite_vec
+
+# Minimum cosine similarity for a cached scene to be served
+DEFAULT_SIMILARITY_THRESHOLD = 0.97
+# Cached scenes older than this are ignored
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+# Neighbours fetched per lookup, so a stale nearest row doesn't hide a fresh one
+LOOKUP_CANDIDATES = 3
+
+class SemanticCache:
+    """Caches scene completions by prompt embedding and serves them for near-duplicate prompts.
+
+    Embeddings live in a sqlite-vec vec0 table partitioned by episode number, with the scene
+    number and a scope (see scope_for) as metadata columns, so a scene prompt is only ever
+    matched against prompts for the same scene of the same episode of the same story. (Scene
+    prompts share most of their text - the episode context, and the character list from
+    memory across stories - so a wider match could replay an unrelated scene.)
+    """
+
+    def __init__(self, db_path, dim=1536, threshold=DEFAULT_SIMILARITY_THRESHOLD, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.enable_load_extension(True)
+        sqlite_vec.load(self._conn)
+        self._conn.enable_load_extension(False)
+
+        self._drop_unscoped_cache()
+        self._conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS scene_cache USING vec0(
+                episode INTEGER PARTITION KEY,
+                scene INTEGER,
+                scope TEXT,
+                embedding FLOAT[{dim}] distance_metric=cosine
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS scene_responses (id INTEGER PRIMARY KEY, response TEXT NOT NULL, ts INTEGER NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        logging.info("Scene cache opened at %s", db_path)
+
+    def _drop_unscoped_cache(self):
+        """Drop a cache written before entries were keyed by scene and scope - its rows can't be scoped"""
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'scene_cache'").fetchone()
+        if row and not ("scene INTEGER" in row[0] and "scope TEXT" in row[0]):
+            logging.info("Dropping scene cache entries that predate per-scene keys")
+            self._conn.execute("DROP TABLE scene_cache")
+            self._conn.execute("DROP TABLE IF EXISTS scene_responses")
+
+    @staticmethod
+    def scope_for(episode_summary):
+        """Cache scope for an episode: entries only match within the same planned episode"""
+        return hashlib.sha256(episode_summary.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _serialize(vector):
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    def lookup(self, scope, episode_number, scene_number, vector):
+        """Return the newest cached response for this scene similar enough to `vector`, or None"""
+        oldest_allowed = int(time.time()) - self.ttl_seconds
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT r.response, r.ts, c.distance
+                FROM (
+                    SELECT rowid, distance FROM scene_cache
+                    WHERE embedding MATCH ? AND k = ? AND episode = ? AND scene = ? AND scope = ?
+                ) AS c
+                JOIN scene_responses AS r ON r.id = c.rowid
+            """, (self._serialize(vector), LOOKUP_CANDIDATES, episode_number, scene_number, scope)).fetchall()
+
+        hits = [(ts, response) for response, ts, distance in rows
+                if 1 - distance >= self.threshold and ts >= oldest_allowed]
+        return max(hits)[1] if hits else None
+
+    def store(self, scope, episode_number, scene_number, vector, response):
+        """Cache a response under its prompt embedding"""
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO scene_responses (response, ts) VALUES (?, ?)", (response, int(time.time())))
+            self._conn.execute("INSERT INTO scene_cache (rowid, episode, scene, scope, embedding) VALUES (?, ?, ?, ?, ?)",
+                               (cursor.lastrowid, episode_number, scene_number, scope, self._serialize(vector)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
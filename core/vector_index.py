@@ -0,0 +1,161 @@
+# core/vector_index.py
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Storage types NumpyVectorStore can keep vectors in
+VECTOR_DTYPES = ("fp32", "fp16", "int8")
+# Rows converted back to float32 at a time during a scan, keeps the temporary buffer cache-sized
+SCAN_BLOCK_ROWS = 4096
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize(vectors, vector_dtype):
+    """Normalize vectors and convert them to the storage type.
+
+    Returns (stored, scales). scales is only used for int8: each vector keeps its own
+    float32 scale so that stored / scale recovers the unit vector.
+    """
+    unit = _normalize(vectors)
+    if vector_dtype == "fp16":
+        return unit.astype(np.float16), None
+    if vector_dtype == "int8":
+        scales = 127.0 / np.maximum(np.abs(unit).max(axis=1), 1e-12)
+        stored = np.clip(np.rint(unit * scales[:, None]), -127, 127).astype(np.int8)
+        return stored, scales.astype(np.float32)
+    return unit, None
+
+class NumpyVectorStore:
+    """Brute-force cosine index over memory-mapped NumPy arrays, with optional fp16 / int8 storage.
+
+    Vectors are normalized at ingest and appended to one contiguous raw file per index, which
+    is mapped read-only, so a cold start only pages in what a scan touches. fp16 halves and
+    int8 quarters the bytes read per KNN scan. Each block is widened to float32 just before
+    its BLAS dot product, and top-k uses argpartition, so the scan runs in C (outside the GIL)
+    at memory bandwidth. Same interface as SqliteVecStore.
+    """
+
+    def __init__(self, path, embedding_function, dim=1536, vector_dtype="int8"):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype '{vector_dtype}'. Use one of: {', '.join(VECTOR_DTYPES)}")
+        self.embedding_function = embedding_function
+        self.dim = dim
+        self.vector_dtype = vector_dtype
+        self._np_dtype = {"fp32": np.float32, "fp16": np.float16, "int8": np.int8}[vector_dtype]
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, f"vectors_{vector_dtype}_{dim}.bin")
+        self._scales_path = os.path.join(path, f"scales_{vector_dtype}_{dim}.f32")
+        self._chunks_path = os.path.join(path, f"chunks_{vector_dtype}_{dim}.jsonl")
+        self._lock = threading.Lock()
+        self._load()
+
+    def _rows_on_disk(self, file_path, row_bytes):
+        return os.path.getsize(file_path) // row_bytes if os.path.exists(file_path) else 0
+
+    def _load(self):
+        self.texts, self.metadatas = [], []
+        if os.path.exists(self._chunks_path):
+            with open(self._chunks_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn final line from a crash mid-write
+                    self.texts.append(row["text"])
+                    self.metadatas.append(row.get("metadata") or {})
+
+        # Vectors are appended before their chunks, so after a crash mid-add the files can
+        # disagree - keep only the rows present in all of them
+        row_counts = [len(self.texts), self._rows_on_disk(self._vectors_path, self.dim * np.dtype(self._np_dtype).itemsize)]
+        if self.vector_dtype == "int8":
+            row_counts.append(self._rows_on_disk(self._scales_path, 4))
+        count = min(row_counts)
+        if any(rows != count for rows in row_counts):
+            logging.warning("Vector index files disagree (%s rows), keeping the first %s", row_counts, count)
+            self.texts, self.metadatas = self.texts[:count], self.metadatas[:count]
+            self._truncate(count)
+        self._map(count)
+        logging.info("NumPy vector index loaded with %s %s vectors", count, self.vector_dtype)
+
+    def _truncate(self, count):
+        for file_path, row_bytes in ((self._vectors_path, self.dim * np.dtype(self._np_dtype).itemsize), (self._scales_path, 4)):
+            if os.path.exists(file_path):
+                with open(file_path, "r+b") as f:
+                    f.truncate(count * row_bytes)
+        with open(self._chunks_path, "w", encoding="utf-8") as f:
+            for text, metadata in zip(self.texts, self.metadatas):
+                f.write(json.dumps({"text": text, "metadata": metadata}) + "\n")
+
+    def _map(self, count):
+        """(Re)map the first `count` rows of the vector files read-only"""
+        if not count:
+            self.vectors, self.scales = None, None
+            return
+        self.vectors = np.memmap(self._vectors_path, dtype=self._np_dtype, mode="r", shape=(count, self.dim))
+        self.scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(count,)) if self.vector_dtype == "int8" else None
+
+    def add_texts(self, texts, metadatas=None):
+        """Embed and store texts (same signature as the LangChain vector stores)"""
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None):
+        """Quantize precomputed embeddings and append them to the index files"""
+        if not texts:
+            return []
+        metadatas = metadatas or [{}] * len(texts)
+        stored, scales = quantize(embeddings, self.vector_dtype)
+        if stored.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {stored.shape[1]}")
+        with self._lock:
+            start = len(self.texts)
+            with open(self._vectors_path, "ab") as f:
+                f.write(stored.tobytes())
+            if scales is not None:
+                with open(self._scales_path, "ab") as f:
+                    f.write(scales.tobytes())
+            with open(self._chunks_path, "a", encoding="utf-8") as f:
+                for text, metadata in zip(texts, metadatas):
+                    f.write(json.dumps({"text": text, "metadata": metadata}) + "\n")
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self._map(len(self.texts))
+        return list(range(start, start + len(texts)))
+
+    def _scores(self, vectors, scales, query_vector):
+        """Cosine similarity of the query against every stored vector"""
+        query = _normalize(query_vector)[0]
+        if self.vector_dtype == "fp32":
+            return vectors @ query  # Straight sgemv over the mapped array
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = vectors[start:start + SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        if scales is not None:
+            scores /= scales
+        return scores
+
+    def similarity_search(self, query, k=4):
+        """Return the k chunks nearest to the query as LangChain Documents"""
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, query_vector, k=4):
+        with self._lock:
+            vectors, scales, texts, metadatas = self.vectors, self.scales, self.texts, self.metadatas
+        if vectors is None or k <= 0:
+            return []
+        # Mappings are replaced, never modified, so the scan runs without holding the lock
+        scores = self._scores(vectors, scales, query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [Document(page_content=texts[i], metadata=metadatas[i]) for i in top]
+
+    def persist(self):
+        """Kept for parity with Chroma - rows are appended to disk as they are added"""
@@ -1,5 +1,6 @@
 # ui/app.py
 # coding: utf-8
+import html
 import streamlit as st
 import sys
 import os
@@ -7,12 +8,14 @@ import os
 # Add the parent directory to Python's path so we can import 'core'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Now we can import from core
-from core.pipeline import StoryPipeline
-import logging # Import logging
+# Now we can import from core. core.pipeline (and the OpenAI / LangChain stack behind it) is
+# imported when the pipeline is first built, so the welcome screen doesn't wait on it.
+from core.episode_store import EpisodeStore
+from utils.config import load_api_key
+from utils.logging_config import configure_logging
 
 # Configure logging for Streamlit (optional, helps debug)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
 # Custom styling
 st.set_page_config(
@@ -22,8 +25,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better styling
-st.markdown("""
+# Custom CSS for better styling. It has to be emitted on every rerun (elements a rerun doesn't
+# produce are removed), so it goes through st.html, which injects it as-is instead of running
+# it through the markdown parser. Older Streamlit versions without st.html fall back to markdown.
+APP_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -74,166 +79,260 @@ st.markdown("""
         width: 100%;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+def static_html(markup):
+    """Render fixed HTML without the markdown parser (st.html), falling back to st.markdown."""
+    if hasattr(st, "html"):
+        st.html(markup)
+    else:
+        st.markdown(markup, unsafe_allow_html=True)
+
+static_html(APP_CSS)
+
+def render_story_header(title, premise, setting=None):
+    """Title, premise and setting boxes of a story plan as one HTML block"""
+    boxes = [f'<h2 class="story-title">{html.escape(str(title))}</h2>',
+             f'<div class="info-box"><b>Premise:</b><p>{html.escape(str(premise))}</p></div>']
+    if setting is not None:
+        boxes.append(f'<div class="info-box"><b>Setting:</b><p>{html.escape(str(setting))}</p></div>')
+    return "\n".join(boxes)
+
+# Scripts longer than this show only their first SCRIPT_PREVIEW_CHARS until expanded
+LONG_SCRIPT_CHARS = 10_000
+SCRIPT_PREVIEW_CHARS = 4_000
+
+# Fixed copy, pre-rendered to HTML so it skips the markdown parser on every rerun
+HOW_IT_WORKS_HTML = """
+<b>How it works:</b>
+<ol>
+    <li>Enter a story prompt in the sidebar</li>
+    <li>Click 'Create New Story' to generate a complete story plan</li>
+    <li>Generate episodes one by one to build your complete story</li>
+    <li>Download your episodes or view AI critiques</li>
+</ol>
+"""
+
+FOOTER_HTML = """
+<p><b>AI Story Pipeline</b> | Made with ❤️ using Streamlit and OpenAI</p>
+<p>Generate complete episodic stories for audio, screenplay, or text formats.</p>
+"""
+
+# Quick-start samples on the welcome screen: (button key, card heading, card text, prompt)
+SAMPLE_PROMPTS = [
+    ("fantasy", "Fantasy Adventure",
+     "A young apprentice mage accidentally teleports their entire village to another realm.",
+     "A fantasy adventure about a young apprentice mage who accidentally teleports their entire village to another realm."),
+    ("mystery", "Mystery",
+     "A lighthouse keeper discovers an ancient secret hidden in their small coastal town's history.",
+     "A mystery story set in a small coastal town where the lighthouse keeper discovers an ancient secret hidden in the town's history."),
+    ("romance", "Romance",
+     "Two rival food truck owners compete for business but gradually fall in love.",
+     "A romantic comedy about two rival food truck owners who compete for business but gradually fall in love."),
+]
+
+SAMPLE_CARDS_HTML = (
+    f'<div style="display: grid; grid-template-columns: repeat({len(SAMPLE_PROMPTS)}, 1fr); gap: 1rem;">'
+    + "".join(f'<div class="info-box"><b>{heading}</b><p>{html.escape(text)}</p></div>' for _, heading, text, _ in SAMPLE_PROMPTS)
+    + "</div>"
+)
 
 # App title and intro with better styling
 st.markdown('<h1 class="main-header">AI Story Pipeline</h1>', unsafe_allow_html=True)
 st.markdown('<p class="subheader">Generate episodic stories powered by AI. Create a new story with a prompt, then generate episodes one by one.</p>', unsafe_allow_html=True)
 
-# Initialize session state variables if they don't exist
-if 'pipeline' not in st.session_state:
-    st.session_state.pipeline = None
-if 'story_plan' not in st.session_state:
-    st.session_state.story_plan = None
-if 'current_episode' not in st.session_state:
-    st.session_state.current_episode = 1
-if 'episodes_generated' not in st.session_state:
-    st.session_state.episodes_generated = {}
+# Initialize session state variables if they don't exist. Callable defaults are factories, so
+# each session gets its own episode store (recent episodes in memory, the rest spilled to disk)
+SESSION_DEFAULTS = {"pipeline": None, "story_plan": None, "current_episode": 1, "episodes_generated": EpisodeStore,
+                    "story_premise": None}
+for key, value in SESSION_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = value() if callable(value) else value
+
+# One OpenAI client per server process, shared by every session. The pipeline itself holds
+# the session's story plan and episodes, so each session still gets its own.
+@st.cache_resource(show_spinner=False)
+def _get_shared_client():
+    from core.pipeline import StoryPipeline
+    return StoryPipeline.build_client(load_api_key())
 
 # Function to initialize the pipeline
 def initialize_pipeline():
     try:
-        st.session_state.pipeline = StoryPipeline()
+        from core.pipeline import StoryPipeline
+        st.session_state.pipeline = StoryPipeline(client=_get_shared_client())
         return True
     except Exception as e:
         st.error(f"Failed to initialize pipeline: {str(e)}")
         return False
 
+def index_story_plan(story_plan):
+    """Derive everything the page reads from a story plan once per plan instead of every rerun"""
+    episodes = story_plan.get("master_outline", [])
+    episode_titles = [f"Episode {ep.get('episode')}: {ep.get('title')}" for ep in episodes]
+    st.session_state.plan_view = {
+        "plan": story_plan,
+        "header_html": render_story_header(story_plan.get("title", "Untitled Story"), story_plan.get("premise", ""), story_plan.get("setting")),
+        "episode_titles": episode_titles,
+        "title_to_idx": {title: i + 1 for i, title in enumerate(episode_titles)},
+        "by_number": {ep.get("episode"): ep for ep in episodes},
+    }
+
 # Function to plan a new story
-def plan_story(user_input):
+def plan_story(user_input, bypass_cache=False):
+    """Plan a story from the premise (bypass_cache=True re-rolls instead of replaying a cached plan)"""
     if st.session_state.pipeline is None:
         if not initialize_pipeline():
             return False
     
     with st.spinner("Planning your story..."):
-        success = st.session_state.pipeline.plan_story(user_input)
+        success = st.session_state.pipeline.plan_story(user_input, bypass_cache=bypass_cache)
         if success:
-            st.session_state.story_plan = st.session_state.pipeline.story_plan
-            st.session_state.current_episode = 1
-            st.session_state.episodes_generated = {}
+            st.session_state.story_premise = user_input
+            # The pipeline keeps the same plan object when the premise replays an unchanged plan,
+            # so the episodes generated for it stay available
+            if st.session_state.pipeline.story_plan is not st.session_state.story_plan:
+                st.session_state.story_plan = st.session_state.pipeline.story_plan
+                st.session_state.current_episode = 1
+                st.session_state.episodes_generated = EpisodeStore()
+                index_story_plan(st.session_state.story_plan)
             return True
         else:
             st.error("Failed to generate story plan")
             return False
 
-# Function to generate an episode
-def generate_episode(episode_number):
+def build_enhanced_prompt(genre, setting, protagonist, conflict):
+    """Combine the optional prompt elements into one premise, or return "" if none were given"""
+    if not (setting or protagonist or conflict):
+        return ""
+    combined_elements = []
+    if genre != "Other": combined_elements.append(f"A {genre.lower()} story about")
+    if protagonist: combined_elements.append(f"a character named {protagonist}")
+    if setting: combined_elements.append(f"in {setting}")
+    if conflict: combined_elements.append(f"who {conflict}")
+    return " ".join(combined_elements)
+
+# Function to generate an episode (bypass_cache=True re-rolls instead of reusing cached scenes)
+def generate_episode(episode_number, bypass_cache=False):
     if st.session_state.pipeline is None or st.session_state.story_plan is None:
         st.error("Please plan a story first")
         return
     
+    pipeline = st.session_state.pipeline
+    previous = pipeline.get_episode_data(episode_number)
     with st.spinner(f"Generating Episode {episode_number}..."):
-        script, critique = st.session_state.pipeline.generate_episode(episode_number)
-        if script:
-            st.session_state.episodes_generated[episode_number] = {
-                "script": script,
-                "critique": critique
-            }
-            return True
-        else:
-            st.error(f"Failed to generate Episode {episode_number}")
-            return False
+        # Live preview of the script as it streams; the cleaned script replaces it once done
+        preview = st.empty()
+        streamed = ""
+        for text in pipeline.generate_episode_stream(episode_number, bypass_cache=bypass_cache):
+            streamed += text
+            preview.text(streamed)
+        preview.empty()
+    
+    # A successful run stores a new entry; a failed one leaves the previous script in place
+    episode = pipeline.get_episode_data(episode_number)
+    if episode is not None and episode is not previous:
+        st.session_state.episodes_generated[episode_number] = dict(episode)
+        return True
+    else:
+        st.error(f"Failed to generate Episode {episode_number}")
+        return False
+
+# Button callbacks run before the rerun their click triggers, so that run already renders the
+# new state - no second st.rerun() pass over the whole page. They only change state: anything a
+# callback draws lands at the top of the page, so generation itself runs in the episode area.
+def go_to_episode(episode_number):
+    st.session_state.current_episode = episode_number
+
+def request_episode(episode_number, bypass_cache=False):
+    """Show an episode and have it generated (bypass_cache=True re-rolls) in the episode area"""
+    st.session_state.pending_episode = (episode_number, bypass_cache)
+    go_to_episode(episode_number)
+
+def open_episode(episode_number):
+    """Show an episode, generating it first if it hasn't been generated yet"""
+    if episode_number not in st.session_state.episodes_generated:
+        request_episode(episode_number)
+    else:
+        go_to_episode(episode_number)
 
 # Create a sidebar for story planning
 with st.sidebar:
     st.header("Story Creation")
     
-    # Add genre selection for better prompting
-    genre = st.selectbox(
-        "Select Genre",
-        ["Science Fiction", "Fantasy", "Mystery", "Romance", "Adventure", "Horror", "Other"]
-    )
+    # Toggling the extra fields has to rerun the script, so this checkbox sits outside the form
+    use_elements = st.checkbox("Add prompt elements", value=False)
     
-    # More visually appealing prompt area
-    st.markdown('<div class="story-prompt">', unsafe_allow_html=True)
-    user_input = st.text_area(
-        "Enter your story premise:",
-        "A team of explorers discovers an ancient alien artifact on a distant moon.",
-        height=100
-    )
-    
-    # Add some example prompt elements
-    if st.checkbox("Add prompt elements", value=False):
-        setting = st.text_input("Setting:", "")
-        protagonist = st.text_input("Main Character:", "")
-        conflict = st.text_input("Central Conflict:", "")
+    # The creation inputs are a form, so editing them doesn't rerun the script - only submitting does
+    with st.form("story_creation", border=False):
+        # Add genre selection for better prompting
+        genre = st.selectbox(
+            "Select Genre",
+            ["Science Fiction", "Fantasy", "Mystery", "Romance", "Adventure", "Horror", "Other"]
+        )
         
-        # Combine elements if provided
-        if setting or protagonist or conflict:
-            combined_elements = []
-            if genre != "Other": combined_elements.append(f"A {genre.lower()} story about")
-            if protagonist: combined_elements.append(f"a character named {protagonist}")
-            if setting: combined_elements.append(f"in {setting}")
-            if conflict: combined_elements.append(f"who {conflict}")
-            if combined_elements:
-                enhanced_prompt = " ".join(combined_elements)
-                st.session_state.enhanced_prompt = enhanced_prompt
-                st.info(f"Enhanced prompt: {enhanced_prompt}")
-                if st.button("Use Enhanced Prompt"):
-                    user_input = enhanced_prompt
-    st.markdown('</div>', unsafe_allow_html=True)
+        user_input = st.text_area(
+            "Enter your story premise:",
+            "A team of explorers discovers an ancient alien artifact on a distant moon.",
+            height=100
+        )
+        
+        # Add some example prompt elements
+        if use_elements:
+            setting = st.text_input("Setting:", "")
+            protagonist = st.text_input("Main Character:", "")
+            conflict = st.text_input("Central Conflict:", "")
+            use_enhanced = st.form_submit_button("Use Enhanced Prompt", use_container_width=True)
+        
+        # More attention-grabbing button
+        create = st.form_submit_button("🚀 Create New Story", use_container_width=True)
     
-    # More attention-grabbing button
-    if st.button("🚀 Create New Story", use_container_width=True):
+    if use_elements and use_enhanced:
+        enhanced_prompt = build_enhanced_prompt(genre, setting, protagonist, conflict)
+        if enhanced_prompt:
+            st.session_state.enhanced_prompt = enhanced_prompt
+            st.info(f"Enhanced prompt: {enhanced_prompt}")
+            plan_story(enhanced_prompt)
+        else:
+            st.warning("Fill in at least one prompt element first")
+    elif create:
         plan_story(user_input)
     
     # Display story info with better styling if available
     if st.session_state.story_plan:
-        st.markdown(f'<h2 class="story-title">{st.session_state.story_plan.get("title", "Untitled Story")}</h2>', unsafe_allow_html=True)
-        
-        # Show premise in a nice box
-        st.markdown('<div class="info-box">', unsafe_allow_html=True)
-        st.markdown("**Premise:**")
-        st.write(st.session_state.story_plan.get("premise", ""))
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Show setting similarly
-        if "setting" in st.session_state.story_plan:
-            st.markdown('<div class="info-box">', unsafe_allow_html=True)
-            st.markdown("**Setting:**")
-            st.write(st.session_state.story_plan.get("setting", ""))
-            st.markdown('</div>', unsafe_allow_html=True)
+        if st.session_state.get("plan_view", {}).get("plan") is not st.session_state.story_plan:
+            index_story_plan(st.session_state.story_plan)
+        plan_view = st.session_state.plan_view
+        static_html(plan_view["header_html"])
+        if st.session_state.story_premise:
+            st.button("🎲 Re-plan Story", use_container_width=True, on_click=plan_story,
+                      args=(st.session_state.story_premise,), kwargs={"bypass_cache": True},
+                      help="Plan this premise again instead of reusing the saved plan")
         
         # Episode selector with progress indicator
         st.subheader("Episodes")
-        episodes = st.session_state.story_plan.get("master_outline", [])
-        episode_titles = [f"Episode {ep.get('episode')}: {ep.get('title')}" for ep in episodes]
+        episode_titles = plan_view["episode_titles"]
         
         # Add visual progress tracking
-        total_episodes = len(episodes)
+        total_episodes = len(episode_titles)
         generated_count = len(st.session_state.episodes_generated)
         st.progress(generated_count / total_episodes if total_episodes > 0 else 0)
         st.write(f"Generated: {generated_count}/{total_episodes} episodes")
         
         selected_episode = st.selectbox("Select an episode:", episode_titles, index=st.session_state.current_episode - 1)
-        selected_index = episode_titles.index(selected_episode) + 1
+        selected_index = plan_view["title_to_idx"][selected_episode]
         
         # Enhanced generation button
         button_text = "Generate Selected Episode"
         if selected_index in st.session_state.episodes_generated:
             button_text = "View Episode"
         
-        if st.button(button_text, use_container_width=True):
-            if selected_index in st.session_state.episodes_generated:
-                st.success(f"Showing Episode {selected_index}")
-            else:
-                generate_episode(selected_index)
-            
-            st.session_state.current_episode = selected_index
-            st.rerun()
+        st.button(button_text, use_container_width=True, on_click=open_episode, args=(selected_index,))
 
 # Main content area with improved UI
 if st.session_state.story_plan:
     # Display the current episode details
     current_ep = st.session_state.current_episode
-    episodes = st.session_state.story_plan.get("master_outline", [])
-    
-    # Find the episode details
-    episode_details = None
-    for ep in episodes:
-        if ep.get("episode") == current_ep:
-            episode_details = ep
-            break
+    episode_details = st.session_state.plan_view["by_number"].get(current_ep)
     
     if episode_details:
         # Create a better episode header with visual indicators
@@ -253,9 +352,15 @@ if st.session_state.story_plan:
             st.markdown("### Summary")
             st.write(episode_details.get("summary", "No summary available"))
             
-            st.markdown("### Key Points")
-            for point in episode_details.get("key_points", []):
-                st.markdown(f"- {point}")
+            # One markdown element for the whole list rather than one per point
+            key_points = "\n".join(f"- {point}" for point in episode_details.get("key_points", []))
+            st.markdown(f"### Key Points\n{key_points}")
+        
+        # Generate the episode the last click asked for, streaming it right here
+        pending = st.session_state.pop("pending_episode", None)
+        if pending and pending[0] == current_ep and generate_episode(*pending):
+            # The status badge and sidebar progress above were drawn before the episode existed
+            st.rerun()
         
         # Show the generated episode content if available
         if current_ep in st.session_state.episodes_generated:
@@ -268,8 +373,16 @@ if st.session_state.story_plan:
             tab1, tab2 = st.tabs(["Script", "AI Critique"])
             
             with tab1:
-                # Don't use HTML for script display as it can cause formatting issues
-                st.code(episode_data["script"], language=None)
+                # Plain text area - no HTML (formatting issues) and no code highlighter pass. Long
+                # scripts show their opening up front and the rest in a collapsed expander.
+                script = episode_data["script"]
+                if len(script) > LONG_SCRIPT_CHARS:
+                    cut = script.rfind("\n", 0, SCRIPT_PREVIEW_CHARS) + 1 or SCRIPT_PREVIEW_CHARS
+                    st.text_area("Script", value=script[:cut], height=600, disabled=True, label_visibility="collapsed")
+                    with st.expander("Show full script"):
+                        st.text_area("Rest of script", value=script[cut:], height=600, disabled=True, label_visibility="collapsed")
+                else:
+                    st.text_area("Script", value=script, height=600, disabled=True, label_visibility="collapsed")
                 
                 # Add download button for the script
                 st.download_button(
@@ -290,80 +403,36 @@ if st.session_state.story_plan:
             
             with col1:
                 if current_ep > 1:
-                    if st.button("← Previous Episode", use_container_width=True):
-                        st.session_state.current_episode = current_ep - 1
-                        st.rerun()
+                    st.button("← Previous Episode", use_container_width=True, on_click=go_to_episode, args=(current_ep - 1,))
             
             with col2:
                 # Regenerate button
-                if st.button("🔄 Regenerate", use_container_width=True):
-                    with st.spinner(f"Regenerating Episode {current_ep}..."):
-                        generate_episode(current_ep)
-                        st.rerun()
+                st.button("🔄 Regenerate", use_container_width=True, on_click=request_episode,
+                          args=(current_ep,), kwargs={"bypass_cache": True})
             
             with col3:
-                if current_ep < len(episodes):
-                    if st.button("Next Episode →", use_container_width=True):
-                        # Automatically generate next episode if not already generated
-                        if current_ep + 1 not in st.session_state.episodes_generated:
-                            generate_episode(current_ep + 1)
-                        
-                        st.session_state.current_episode = current_ep + 1
-                        st.rerun()
+                if current_ep < len(st.session_state.plan_view["episode_titles"]):
+                    # Automatically generates the next episode if not already generated
+                    st.button("Next Episode →", use_container_width=True, on_click=open_episode, args=(current_ep + 1,))
         else:
             # Show a button to generate this episode
             st.markdown("<br>", unsafe_allow_html=True)
-            if st.button(f"✨ Generate Episode {current_ep}", use_container_width=True):
-                generate_episode(current_ep)
-                st.rerun()
+            st.button(f"✨ Generate Episode {current_ep}", use_container_width=True, on_click=request_episode, args=(current_ep,))
 else:
     # Show a more engaging welcome screen
     st.markdown('<div class="info-box">', unsafe_allow_html=True)
     st.info("👋 Welcome to AI Story Pipeline! Get started by creating your first story.")
-    st.markdown("**How it works:**")
-    st.markdown("1. Enter a story prompt in the sidebar")
-    st.markdown("2. Click 'Create New Story' to generate a complete story plan")
-    st.markdown("3. Generate episodes one by one to build your complete story")
-    st.markdown("4. Download your episodes or view AI critiques")
+    static_html(HOW_IT_WORKS_HTML)
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Sample prompts as cards in columns
     st.subheader("Quick Start with Sample Prompts")
     
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown('<div class="info-box">', unsafe_allow_html=True)
-        st.markdown("**Fantasy Adventure**")
-        st.write("A young apprentice mage accidentally teleports their entire village to another realm.")
-        if st.button("Use This Prompt", key="fantasy", use_container_width=True):
-            prompt = "A fantasy adventure about a young apprentice mage who accidentally teleports their entire village to another realm."
-            st.sidebar.text_area("Enter your story premise:", prompt)
-            plan_story(prompt)
-            st.rerun()
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown('<div class="info-box">', unsafe_allow_html=True)
-        st.markdown("**Mystery**")
-        st.write("A lighthouse keeper discovers an ancient secret hidden in their small coastal town's history.")
-        if st.button("Use This Prompt", key="mystery", use_container_width=True):
-            prompt = "A mystery story set in a small coastal town where the lighthouse keeper discovers an ancient secret hidden in the town's history."
-            st.sidebar.text_area("Enter your story premise:", prompt)
-            plan_story(prompt)
-            st.rerun()
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown('<div class="info-box">', unsafe_allow_html=True)
-        st.markdown("**Romance**")
-        st.write("Two rival food truck owners compete for business but gradually fall in love.")
-        if st.button("Use This Prompt", key="romance", use_container_width=True):
-            prompt = "A romantic comedy about two rival food truck owners who compete for business but gradually fall in love."
-            st.sidebar.text_area("Enter your story premise:", prompt)
-            plan_story(prompt)
-            st.rerun()
-        st.markdown('</div>', unsafe_allow_html=True)
+    # The three cards are one static HTML grid; only the buttons under them are widgets
+    static_html(SAMPLE_CARDS_HTML)
+    for column, (key, _, _, prompt) in zip(st.columns(len(SAMPLE_PROMPTS)), SAMPLE_PROMPTS):
+        with column:
+            st.button("Use This Prompt", key=key, use_container_width=True, on_click=plan_story, args=(prompt,))
     
     # Showcase section
     st.markdown("<br>", unsafe_allow_html=True)
@@ -372,17 +441,17 @@ else:
     features_col1, features_col2 = st.columns(2)
     
     with features_col1:
-        st.markdown("✨ **Complete Story Planning**")
+        static_html("✨ <b>Complete Story Planning</b>")
         st.write("Generate coherent multi-episode stories with well-developed characters and plot arcs")
         
-        st.markdown("📝 **Professional Scripts**")
+        static_html("📝 <b>Professional Scripts</b>")
         st.write("Create ready-to-produce episode scripts with proper formatting")
     
     with features_col2:
-        st.markdown("🔄 **Continuous Context**")
+        static_html("🔄 <b>Continuous Context</b>")
         st.write("AI remembers characters, plot points, and events across episodes")
         
-        st.markdown("👁️ **AI Critical Review**")
+        static_html("👁️ <b>AI Critical Review</b>")
         st.write("Each episode comes with an AI critique for quality assurance")
 
 # Better footer information
@@ -390,13 +459,9 @@ st.markdown("---")
 col1, col2 = st.columns([3, 1])
 
 with col1:
-    st.markdown("""
-    **AI Story Pipeline** | Made with ❤️ using Streamlit and OpenAI
-    
-    Generate complete episodic stories for audio, screenplay, or text formats.
-    """)
+    static_html(FOOTER_HTML)
 
 with col2:
-    st.markdown("**Version:** 1.0")
+    static_html("<b>Version:</b> 1.0")
     current_year = 2025  # You could use datetime.now().year for dynamic year
-    st.markdown(f"© {current_year} KUKU_FM")
\ No newline at end of file
+    st.text(f"© {current_year} KUKU_FM")
\ No newline at end of file
@@ -0,0 +1,35 @@
+# utils/async_runner.py
+import asyncio
+import threading
+
+# A single long-lived event loop shared by all sync callers. The async OpenAI client
+# keeps pooled connections bound to the loop they were opened on, so a fresh
+# asyncio.run() per call would leave it holding connections of a closed loop.
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    """Start the background event loop on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="story-pipeline-loop", daemon=True)
+            thread.start()
+    return _loop
+
+def submit(coro):
+    """Start a coroutine on the background event loop and return its concurrent.futures.Future."""
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("Called from inside the pipeline event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+def run_sync(coro):
+    """Run a coroutine on the background event loop and block until it finishes."""
+    return submit(coro).result()
@@ -6,22 +6,54 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# API Models - All these models support JSON response format
+# API Models - the planner and updater need Structured Outputs (json_schema) support
 DEFAULT_MODEL = "gpt-3.5-turbo-0125"
-PLANNER_MODEL = "gpt-4-turbo-preview"
+PLANNER_MODEL = "gpt-4o"
 GENERATOR_MODEL = "gpt-4-turbo-preview"
 REFINER_MODEL = "gpt-4-turbo-preview"
-UPDATER_MODEL = "gpt-3.5-turbo-0125"
+UPDATER_MODEL = "gpt-4o-mini"
+SUMMARIZER_MODEL = "gpt-4o-mini"  # Compresses earlier scenes during episode generation
+
+# OpenAI rate limits for the shared client - set these to your account tier
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "30000"))
+# Retries for 429 / 5xx / connection errors, with exponential backoff and jitter
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+# Embeddings for story memory: "openai" (text-embedding API) or "minilm" (local all-MiniLM-L6-v2)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+# Set USE_SCENE_CACHE=1 to reuse cached scenes for near-identical scene prompts (needs sqlite-vec;
+# costs one prompt embedding per scene)
+USE_SCENE_CACHE = os.getenv("USE_SCENE_CACHE", "0").lower() in ("1", "true", "yes")
+
+# Set USE_VEC_INDEX=1 to keep story chunks in a local sqlite-vec index instead of Chroma
+USE_VEC_INDEX = os.getenv("USE_VEC_INDEX", "0").lower() in ("1", "true", "yes")
+
+# Disk cache of chat completion texts for planner / refiner calls (set LLM_CACHE_PATH= to disable)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "story_gen", "llm", "responses.sqlite3"))
+
+# Set VECTOR_DTYPE to fp32, fp16 or int8 to use the in-process NumPy index with that storage type
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE") or None
+
+# The key found by load_api_key(); a missing key isn't remembered, so one set later is picked up
+_api_key = None
 
 def load_api_key():
-    """Get API key from environment variables."""
+    """Get API key from environment variables (read once per process once found)."""
+    global _api_key
+    if _api_key:
+        return _api_key
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         logging.error("OPENAI_API_KEY not found in environment variables")
         # List the environment variables for debugging
-        logging.debug("Available environment variables: " + ", ".join(os.environ.keys()))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Available environment variables: %s", ", ".join(os.environ.keys()))
     else:
         # Log that we found the key (without showing the full key)
         masked_key = api_key[:4] + "..." + api_key[-4:] if len(api_key) > 8 else "***"
-        logging.info(f"Found API key: {masked_key}")
+        logging.info("Found API key: %s", masked_key)
+        _api_key = api_key
     return api_key
\ No newline at end of file
@@ -0,0 +1,340 @@
+# utils/llm_client.py
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from types import SimpleNamespace
+
+import httpx
+import orjson
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from utils.config import MAX_CONCURRENT_REQUESTS, MAX_RETRIES, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+
+# Completion budget reserved for calls that don't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# Connection pool shared by every call through one client. Long completions keep the SDK's
+# generous read timeout, but an unreachable host fails fast.
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+# Seconds between Batch API status checks
+BATCH_POLL_INTERVAL = 30
+BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+def _http2_available():
+    """HTTP/2 needs the optional h2 package (pip install "httpx[http2]")."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+@lru_cache(maxsize=None)
+def _encoding_for(model):
+    """Get the tiktoken encoding for a model, falling back to cl100k_base."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def estimate_tokens(model, text):
+    """Count the tokens `text` will use for `model`."""
+    return len(_encoding_for(model).encode(text or ""))
+
+def stable_seed(text):
+    """Deterministic 32-bit `seed` for a request, the same in every process (unlike hash())."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "big")
+
+def strict_object(properties):
+    """JSON Schema object for Structured Outputs strict mode: every property required, no extras."""
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def json_schema_format(name, schema):
+    """response_format that constrains a completion to `schema` (needs gpt-4o / gpt-4o-mini or later)."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+class RateLimiter:
+    """Thread-safe RPM/TPM budget shared by sync and async callers.
+
+    Both budgets refill continuously and may go negative. A caller that overdraws is told
+    how long to wait, so requests get spread evenly instead of bursting into 429s.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def reserve(self, tokens):
+        """Reserve one request and `tokens` tokens. Returns the seconds to wait before sending."""
+        with self._lock:
+            self._refill()
+            self._requests -= 1
+            self._tokens -= tokens
+            wait_requests = max(0.0, -self._requests) * 60 / self.requests_per_minute
+            wait_tokens = max(0.0, -self._tokens) * 60 / self.tokens_per_minute
+            return max(wait_requests, wait_tokens)
+
+    def settle(self, reserved_tokens, used_tokens):
+        """Give back the unused part of a reservation once the real usage is known."""
+        with self._lock:
+            self._tokens += reserved_tokens - used_tokens
+
+class ConcurrentOpenAI:
+    """Shared OpenAI client with bounded concurrency, RPM/TPM throttling and token accounting."""
+
+    def __init__(self, api_key, max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, response_cache=None,
+                 max_retries=MAX_RETRIES):
+        # Every request multiplexes over a few pooled, kept-alive connections (one HTTP/2
+        # connection when h2 is installed), so TLS handshakes aren't repeated per call.
+        # The SDK retries transient failures itself (jittered exponential backoff, honouring
+        # Retry-After), so a single 429 or 5xx doesn't fail a whole plan or episode.
+        http2 = _http2_available()
+        self.client = OpenAI(api_key=api_key, max_retries=max_retries,
+                             http_client=DefaultHttpxClient(http2=http2, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT))
+        self.aclient = AsyncOpenAI(api_key=api_key, max_retries=max_retries,
+                                   http_client=DefaultAsyncHttpxClient(http2=http2, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT))
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_concurrent_requests = max_concurrent_requests
+        self._sync_slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self._async_slots = None  # Created on first use so it binds to the pipeline event loop
+        self.response_cache = response_cache  # Optional ResponseCache used by chat_text / achat_text
+        self._inflight = {}  # request digest -> task, so identical concurrent achat_text calls share one request
+        self.usage = {}  # { model: {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0} }
+        self._usage_lock = threading.Lock()
+
+    def _estimate_request_tokens(self, kwargs):
+        prompt_text = "".join(message.get("content") or "" for message in kwargs.get("messages", []))
+        return estimate_tokens(kwargs["model"], prompt_text) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+    def _record(self, model, reserved_tokens, response):
+        """Settle the token reservation and add the call's usage to the running totals."""
+        self._record_usage(model, reserved_tokens, getattr(response, "usage", None), response is not None)
+        if response is not None:
+            # Seeded requests are only reproducible while the backend fingerprint stays the same
+            logging.debug("%s response, system_fingerprint=%s", model, getattr(response, "system_fingerprint", None))
+
+    def _record_usage(self, model, reserved_tokens, usage, completed=True):
+        used_tokens = usage.total_tokens if usage else 0
+        self.limiter.settle(reserved_tokens, used_tokens)
+        if completed:
+            self._add_usage(model, usage)
+
+    def _add_usage(self, model, usage):
+        with self._usage_lock:
+            totals = self.usage.setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["requests"] += 1
+            if usage:
+                totals["prompt_tokens"] += usage.prompt_tokens
+                totals["completion_tokens"] += usage.completion_tokens
+
+    def chat(self, **kwargs):
+        """Blocking chat.completions.create() that respects the shared limits."""
+        reserved_tokens = self._estimate_request_tokens(kwargs)
+        response = None
+        with self._sync_slots:
+            time.sleep(self.limiter.reserve(reserved_tokens))
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+            finally:
+                self._record(kwargs["model"], reserved_tokens, response)
+        return response
+
+    async def achat(self, **kwargs):
+        """Async chat.completions.create() that respects the shared limits."""
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrent_requests)
+        reserved_tokens = self._estimate_request_tokens(kwargs)
+        response = None
+        async with self._async_slots:
+            await asyncio.sleep(self.limiter.reserve(reserved_tokens))
+            try:
+                response = await self.aclient.chat.completions.create(**kwargs)
+            finally:
+                self._record(kwargs["model"], reserved_tokens, response)
+        return response
+
+    def _cached_text(self, kwargs, bypass_cache):
+        """Returns (cache_key, cached_text). The key is None when caching doesn't apply."""
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.key_for(kwargs)
+        return key, None if bypass_cache else self.response_cache.get(key)
+
+    def _store_text(self, key, text, kwargs):
+        if key is None or not text:
+            return
+        if (kwargs.get("response_format") or {}).get("type") in ("json_object", "json_schema"):
+            try:
+                orjson.loads(text)
+            except ValueError:
+                return  # Never replay a malformed JSON answer
+        self.response_cache.put(key, text)
+
+    def chat_text(self, bypass_cache=False, **kwargs):
+        """chat() returning just the message text, served from the response cache when possible."""
+        key, text = self._cached_text(kwargs, bypass_cache)
+        if text is None:
+            text = self.chat(**kwargs).choices[0].message.content
+            self._store_text(key, text, kwargs)
+        return text
+
+    async def achat_text(self, bypass_cache=False, **kwargs):
+        """Async chat_text(). Identical requests already in flight share one API call."""
+        key, text = self._cached_text(kwargs, bypass_cache)
+        if text is not None:
+            return text
+        if bypass_cache:
+            return await self._fetch_text(key, kwargs)
+        
+        digest = hashlib.blake2b(orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS, default=str)).digest()
+        task = self._inflight.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_text(key, kwargs))
+            self._inflight[digest] = task
+            task.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        # Shielded so one caller being cancelled doesn't cancel the request for the others
+        return await asyncio.shield(task)
+    
+    async def _fetch_text(self, key, kwargs):
+        text = (await self.achat(**kwargs)).choices[0].message.content
+        self._store_text(key, text, kwargs)
+        return text
+
+    async def astream_text(self, stop_marker=None, on_text=None, **kwargs):
+        """Streaming chat completion that returns the accumulated text.
+
+        With `stop_marker`, the stream is closed as soon as the marker shows up so the
+        remaining max_tokens are never generated. `on_text`, if given, is called with each
+        text delta as it arrives. Usage comes from the final stream chunk, or is estimated
+        from the text received when the stream is cut short.
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrent_requests)
+        reserved_tokens = self._estimate_request_tokens(kwargs)
+        pieces, usage, completed = [], None, False
+        async with self._async_slots:
+            await asyncio.sleep(self.limiter.reserve(reserved_tokens))
+            try:
+                stream = await self.aclient.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **kwargs)
+                completed = True
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    pieces.append(chunk.choices[0].delta.content or "")
+                    if on_text and pieces[-1]:
+                        on_text(pieces[-1])
+                    # The marker may be split across deltas, so only check the tail
+                    if stop_marker and stop_marker in "".join(pieces[-8:]):
+                        await stream.close()
+                        break
+            finally:
+                if completed and usage is None:
+                    prompt_tokens = reserved_tokens - kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+                    completion_tokens = estimate_tokens(kwargs["model"], "".join(pieces))
+                    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                            total_tokens=prompt_tokens + completion_tokens)
+                self._record_usage(kwargs["model"], reserved_tokens, usage, completed)
+        return "".join(pieces)
+
+    def run_batch(self, requests, poll_interval=BATCH_POLL_INTERVAL):
+        """Run chat completions through the Batch API (half price, results within 24h).
+
+        `requests` maps custom_id -> chat.completions.create() kwargs. Blocks until the batch
+        finishes and returns custom_id -> response body dict, or None for failed requests.
+        Batch jobs have their own queue limits, so they bypass the RPM/TPM limiter.
+        """
+        lines = []
+        for custom_id, body in requests.items():
+            body = dict(body)
+            body.update(body.pop("extra_body", None) or {})  # The batch body is sent as-is
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}))
+        batch_file = self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        logging.info("Submitted batch %s with %s requests", batch.id, len(requests))
+
+        while batch.status not in BATCH_FINAL_STATES:
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        logging.info("Batch %s finished with status '%s'", batch.id, batch.status)
+
+        results = dict.fromkeys(requests)
+        # Expired batches still return whatever finished before the deadline
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                row = orjson.loads(line)
+                response = row.get("response") or {}
+                if response.get("status_code") == 200:
+                    body = response["body"]
+                    results[row["custom_id"]] = body
+                    usage = body.get("usage")
+                    self._add_usage(body.get("model", "batch"), SimpleNamespace(**usage) if usage else None)
+                else:
+                    logging.error("Batch request %s failed: %s", row["custom_id"], row.get("error") or response)
+        return results
+
+    def wrap_embeddings(self, embeddings):
+        """Route a LangChain embeddings object through this client's rate limiter."""
+        return ThrottledEmbeddings(embeddings, self.limiter)
+
+    def usage_summary(self):
+        """Human readable token usage per model."""
+        with self._usage_lock:
+            lines = [f"{model}: {totals['requests']} requests, {totals['prompt_tokens']} prompt / "
+                     f"{totals['completion_tokens']} completion tokens"
+                     for model, totals in self.usage.items()]
+        return "\n".join(lines) if lines else "No OpenAI usage recorded."
+
+class ThrottledEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that reserves RPM/TPM capacity before every call."""
+
+    def __init__(self, base, limiter):
+        self.base = base
+        self.limiter = limiter
+        self.model = getattr(base, "model", "text-embedding-ada-002")
+
+    def _reserve(self, texts):
+        """Reserve capacity for embedding `texts`, returning the seconds to wait."""
+        return self.limiter.reserve(sum(estimate_tokens(self.model, text) for text in texts))
+
+    def embed_documents(self, texts):
+        delay = self._reserve(texts)
+        time.sleep(delay)
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        delay = self._reserve([text])
+        time.sleep(delay)
+        return self.base.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        delay = self._reserve(texts)
+        await asyncio.sleep(delay)
+        return await self.base.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        delay = self._reserve([text])
+        await asyncio.sleep(delay)
+        return await self.base.aembed_query(text)
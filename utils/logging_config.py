@@ -0,0 +1,17 @@
+# utils/logging_config.py
+import logging
+import os
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Set LOG_LEVEL=WARNING to silence the per-scene / per-update INFO logs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+def configure_logging():
+    """Configure the root logger once for the whole app. Later calls are no-ops.
+
+    Called at the top of the UI script, i.e. on every Streamlit rerun, so it returns before
+    basicConfig once the root logger has handlers.
+    """
+    if logging.getLogger().handlers:
+        return
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)